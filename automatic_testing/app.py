@@ -1,18 +1,38 @@
 import os
-import re
-import time
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, jsonify, request, send_file
 import subprocess
-import psutil
 import urllib.parse
-from tessy_utils import TessyManager
+from tessy_utils import TessyManager, wait_until
+from tessy_jobs import DONE, FAILED, TessyJobQueue
+from tessy_session import SessionManager
+from tessy_process import ProcessTracker
+from tessy_coverage import script_hash
+from tessy_script import sanitize_script
+from tessy_reports import LineWindowReader, iter_file, iter_gzip, iter_json_object
 
 app = Flask(__name__)
+TESSY_START_TIMEOUT = 120
+TESSY_READY_TIMEOUT = 30
+REPORT_WAIT_TIMEOUT = 60
+MAX_REPORT_LINES = 5000
 # global variables
 tessy_process = None
-test_case = None
-case_content = []
+tessy_tracker = ProcessTracker('TESSY.exe')
 tessy_manager = TessyManager()
+tessy_manager.report_index.start_watcher()
+# 每个客户端(X-Client-Token请求头或token参数)有独立的用例缓存和数据目录, Tessy后端通过backend_lock串行访问
+sessions = SessionManager(base_dir='data')
+job_queue = TessyJobQueue(tessy_manager, backend_lock=sessions.backend_lock)
+report_lines = LineWindowReader()
+
+
+@app.before_request
+def load_workspace():
+    token = request.headers.get('X-Client-Token') or request.args.get('token')
+    try:
+        g.workspace = sessions.get(token)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
 
 @app.route('/')
@@ -21,64 +41,120 @@ def home():
 
 @app.route('/start_tessy', methods=['POST'])
 def start_tessy():
-    if is_tessy_running():
-        return jsonify({"output": "Tessy.exe is already running"}), 200
     global tessy_process
-    tessy_command = 'Tessy.exe'  
     file_path = request.args.get('file_path')
-    if not file_path:
-        return jsonify({"error": "File path is required"}), 400
-    try:
-        tessy_process = subprocess.Popen([tessy_command, '--file', file_path], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-        time.sleep(30)  # Wait for Tessy to start
+    with sessions.backend_lock:
         if is_tessy_running():
-            tessy_message = "Tessy.exe opened successfully\n"
-        else:
-            tessy_message = "Tessy.exe failed to open\n"
-        return jsonify({"output": tessy_message})
-    except subprocess.CalledProcessError as e:
-        error_message = e.stderr.decode('utf-8')
-        return jsonify({"error": error_message}), 500
+            return jsonify({"output": "Tessy.exe is already running"}), 200
+        tessy_command = 'Tessy.exe'  
+        if not file_path:
+            return jsonify({"error": "File path is required"}), 400
+        try:
+            tessy_process = subprocess.Popen([tessy_command, '--file', file_path], stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            tessy_tracker.track(tessy_process.pid)
+            # 新启动的Tessy没有之前的连接和选择状态
+            tessy_manager.cmd.reset()
+            # Wait for Tessy to start: 进程出现并且tessycmd connect成功即返回, 进程提前退出时放弃
+            ready = wait_until(lambda: is_tessy_running() and tessy_manager.connect_tessy(),
+                               timeout=TESSY_START_TIMEOUT, initial_interval=1.0,
+                               abort=lambda: tessy_process.poll() is not None)
+            if ready:
+                tessy_message = "Tessy.exe opened successfully\n"
+            else:
+                tessy_message = "Tessy.exe failed to open\n"
+            return jsonify({"output": tessy_message})
+        except subprocess.CalledProcessError as e:
+            error_message = e.stderr.decode('utf-8')
+            return jsonify({"error": error_message}), 500
+
+@app.route('/tessy_health', methods=['GET'])
+def tessy_health():
+    return jsonify(tessy_tracker.health()), 200
 
 @app.route('/set_env', methods=['POST'])
 def set_env():
-    global test_case
+    workspace = g.workspace
     if 'file' not in request.files:
         return jsonify({"error": "No file part"}), 400
     
     file = request.files['file']
-    save_directory = 'data'
-    save_path = os.path.join(save_directory, file.filename)
+    filename = os.path.basename(file.filename)
+    save_path = os.path.join(workspace.data_dir, filename)
     file.save(save_path)
-    time.sleep(10)
-
-    if not tessy_manager.tessy_project_init():
-            return jsonify({"error": "Failed to initialize Tessy project"}), 500
-    # tessy.tessy_project_init()
-    filename_without_extension = os.path.splitext(file.filename)[0]
-    test_case = filename_without_extension
 
-    if not tessy_manager.update_tessy_test_object(filename_without_extension):
-        return jsonify({"error": "Failed to update test object"}), 500
-    # tessy.update_tessy_test_object(filename_without_extension)
+    filename_without_extension = os.path.splitext(filename)[0]
+    with sessions.backend_lock:
+        # connect()在已连接时直接返回, 这里重新connect才能真正检查Tessy是否可用(列表缓存保留)
+        if not wait_until(lambda: tessy_manager.connect_tessy(reconnect=True), timeout=TESSY_READY_TIMEOUT):
+            return jsonify({"error": "Tessy is not ready"}), 503
+        if not tessy_manager.tessy_project_init():
+                return jsonify({"error": "Failed to initialize Tessy project"}), 500
+        # tessy.tessy_project_init()
+        if not tessy_manager.update_tessy_test_object(filename_without_extension):
+            return jsonify({"error": "Failed to update test object"}), 500
+        # tessy.update_tessy_test_object(filename_without_extension)
+    with workspace.lock:
+        workspace.test_case = filename_without_extension
     return jsonify({"output": "环境配置完成..."})
 
 @app.route('/run_case', methods=['GET'])
 def run_case():
-    file_path = os.path.join('data', test_case + '.script')
-    print('file_path:', file_path)
-    if not tessy_manager.execute_tessy_test_object(file_path):
-        return jsonify({"error": "Failed to execute test case"}), 500
-    
-    case_content.clear()
-    return jsonify({"output": "Case is running..."})
+    workspace = g.workspace
+    with workspace.lock:
+        if not workspace.test_case:
+            return jsonify({"error": "Test environment is not set"}), 400
+        file_path = workspace.script_path()
+        print('file_path:', file_path)
+        if not os.path.exists(file_path):
+            return jsonify({"error": f"Test script not found: {os.path.basename(file_path)}"}), 404
+        # prune_covered=1: 按之前执行的报告删除覆盖已被其他用例达到的用例
+        job = job_queue.submit(workspace.test_case, file_path,
+                               prune_covered=bool(request.args.get('prune_covered', 0, type=int)))
+        workspace.last_run_at = job.created_at
+        workspace.case_content.clear()
+    return jsonify({"output": "Case is running...", "job_id": job.job_id,
+                    "position": job_queue.position(job.job_id)}), 202
+
+@app.route('/job_status/<job_id>', methods=['GET'])
+def job_status(job_id):
+    # wait>0 时长轮询: 最多等待wait秒, 状态变化(version与客户端传入的不同)或任务结束时立即返回
+    wait = min(request.args.get('wait', 0, type=float), 60)
+    version = request.args.get('version', type=int)
+    if wait > 0:
+        job = job_queue.wait(job_id, timeout=wait, since_version=version)
+    else:
+        job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({'error': f"Job '{job_id}' not found"}), 404
+    data = job.to_dict()
+    data['version'] = job.version
+    data['position'] = job_queue.position(job_id)
+    return jsonify(data), 200
 
 @app.route('/report_status', methods=['GET'])
 def report_status():
-    time.sleep(10)
+    job_id = request.args.get('job_id')
+    if job_id:
+        job = job_queue.get(job_id)
+        if job is None:
+            return jsonify({'error': f"Job '{job_id}' not found"}), 404
+        if job.state == FAILED:
+            return jsonify({'message': 'Failed', 'info': job.error, 'state': job.state}), 200
+        if job.state != DONE:
+            return jsonify({'message': 'Running', 'state': job.state}), 202
+        if job.coverage_ok:
+            return jsonify({'message': 'Success', 'report': job.report}), 200
+        return jsonify({'message': 'Failed', 'info': 'Test case failed'}), 200
+
     try:
-        report = tessy_manager.get_xml_report(test_case)
-        is_success = tessy_manager.check_report_coverage(report)
+        # 等待本次执行后生成的新报告, 没有执行记录时直接取最新报告
+        workspace = g.workspace
+        timeout = min(request.args.get('timeout', REPORT_WAIT_TIMEOUT, type=float), REPORT_WAIT_TIMEOUT)
+        report = tessy_manager.wait_for_report(workspace.test_case, since=workspace.last_run_at or 0,
+                                               timeout=timeout)
+        if report is None:
+            raise FileNotFoundError(f"No matching XML report found for test case '{workspace.test_case}'")
+        is_success = tessy_manager.check_report_coverage(report, script_hash(workspace.script_path()))
         if is_success:
             return jsonify({'message': 'Success', 'report': report}), 200
         else:
@@ -88,20 +164,98 @@ def report_status():
     except Exception as e:
         return jsonify({'error': f'Unexpected error: {str(e)}'}), 500
 
+@app.route('/coverage_history', methods=['GET'])
+def coverage_history():
+    """测试对象的覆盖率历史, 可用type参数只看某一种覆盖率(如 BRANCH)"""
+    test_object = request.args.get('test_object') or g.workspace.test_case
+    if not test_object:
+        return jsonify({'error': 'test_object is required'}), 400
+    runs = tessy_manager.coverage_store.history(test_object, request.args.get('type'))
+    return jsonify({'test_object': test_object, 'runs': runs}), 200
+
+@app.route('/coverage_compare', methods=['GET'])
+def coverage_compare():
+    """最近一次脚本修改前后的覆盖率对比, 默认对比BRANCH(C1)"""
+    test_object = request.args.get('test_object') or g.workspace.test_case
+    if not test_object:
+        return jsonify({'error': 'test_object is required'}), 400
+    comparison = tessy_manager.coverage_store.compare_scripts(test_object, request.args.get('type', 'BRANCH'))
+    if comparison is None:
+        return jsonify({'error': f"No runs with different scripts found for '{test_object}'"}), 404
+    return jsonify(comparison), 200
+
+def accepts_gzip():
+    return request.accept_encodings['gzip'] > 0 and request.args.get('gzip') != '0'
+
+def streamed(chunks, mimetype):
+    """流式响应, 客户端支持时用gzip压缩"""
+    if accepts_gzip():
+        response = Response(iter_gzip(chunks), mimetype=mimetype)
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = Response(chunks, mimetype=mimetype)
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
+
 @app.route('/get_report', methods=['GET'])
 def get_report():
+    """c0/c1文本报告, 返回格式不变({'c0_content': .., 'c1_content': ..}), 但按块流式输出, 不把整个文件读进内存"""
     try:
-        report_c0, report_c1 = tessy_manager.get_txt_report(test_case)
-        
-        content_c0 = tessy_manager.read_file_content(report_c0)
-        content_c1 = tessy_manager.read_file_content(report_c1)
+        report_c0, report_c1 = tessy_manager.get_txt_report(g.workspace.test_case)
         
-        report_data = {
-            'c0_content': content_c0,
-            'c1_content': content_c1
-        }
+        fields = [('c0_content', report_c0), ('c1_content', report_c1)]
         
-        return jsonify(report_data), 200
+        return streamed(iter_json_object(fields), 'application/json')
+    except FileNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
+    except Exception as e:
+        return jsonify({'error': f'Unexpected error: {str(e)}'}), 500
+
+@app.route('/get_report/<kind>', methods=['GET'])
+def download_report(kind):
+    """
+    下载单个文本报告(kind为c0或c1), 支持Range断点续传和If-None-Match/If-Modified-Since
+    gzip=1(不带Range且客户端接受gzip)时压缩后流式输出, 同样支持If-None-Match/If-Modified-Since
+    """
+    if kind not in ('c0', 'c1'):
+        return jsonify({'error': f"Unknown report kind '{kind}'"}), 404
+    try:
+        report_c0, report_c1 = tessy_manager.get_txt_report(g.workspace.test_case)
+        report = report_c0 if kind == 'c0' else report_c1
+        # 只在明确要求时压缩: 普通客户端都会带Accept-Encoding: gzip, 应该走下面支持Range和条件请求的send_file
+        if request.range is None and request.args.get('gzip', 0, type=int) and accepts_gzip():
+            stat = os.stat(report)
+            response = streamed(iter_file(report), 'text/plain')
+            response.headers['Content-Disposition'] = f'inline; filename="{os.path.basename(report)}"'
+            response.set_etag(f'{stat.st_mtime_ns:x}-{stat.st_size:x}-gzip')
+            response.last_modified = int(stat.st_mtime)
+            return response.make_conditional(request)
+        return send_file(report, mimetype='text/plain', conditional=True,
+                         download_name=os.path.basename(report))
+    except FileNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
+    except Exception as e:
+        return jsonify({'error': f'Unexpected error: {str(e)}'}), 500
+
+@app.route('/get_report/<kind>/lines', methods=['GET'])
+def report_lines_window(kind):
+    """按行分页浏览文本报告: start为起始行(从0开始), count为行数(最多MAX_REPORT_LINES)"""
+    if kind not in ('c0', 'c1'):
+        return jsonify({'error': f"Unknown report kind '{kind}'"}), 404
+    try:
+        start = max(request.args.get('start', 0, type=int), 0)
+        count = min(max(request.args.get('count', 500, type=int), 1), MAX_REPORT_LINES)
+        report_c0, report_c1 = tessy_manager.get_txt_report(g.workspace.test_case)
+        report = report_c0 if kind == 'c0' else report_c1
+        lines, total = report_lines.read(report, start, count)
+        next_start = start + len(lines)
+        return jsonify({
+            'report': os.path.basename(report),
+            'start': start,
+            'lines': lines,
+            'total_lines': total,
+            'next_start': next_start if next_start < total else None,
+        }), 200
     except FileNotFoundError as e:
         return jsonify({'error': str(e)}), 404
     except Exception as e:
@@ -109,27 +263,28 @@ def get_report():
 
 @app.route('/generate_case', methods=['POST'])
 def generate_case():
+    workspace = g.workspace
     try:
         script_content = request.args.get('script_content')
         print('script_content:', script_content)
         if script_content is None:
             return jsonify({'error': 'Missing script_content parameter'}), 400
         
-        script_content = tessy_manager.modify_text_style(script_content)
-        case_content.append(script_content)
-        
-        file_name = f'{test_case}.script'
-        file_path = os.path.join('data', file_name)
-        os.makedirs('data', exist_ok=True)
-        
-        with open(file_path, 'w', encoding='utf-8') as file:
-            file.writelines(script_content.splitlines(keepends=True))
+        # 到达时规范化一次(去掉代码块标记和testcase标签, 补齐括号), 保存时不再处理
+        script_content, _ = sanitize_script(script_content, clear_uuids=False)
+        with workspace.lock:
+            workspace.case_content.append_normalized(script_content)
+            
+            file_path = workspace.script_path()
+            with open(file_path, 'w', encoding='utf-8') as file:
+                file.writelines(script_content.splitlines(keepends=True))
         return jsonify({'message': 'Script generated successfully'}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/split_case', methods=['POST'])
 def split_case():
+    workspace = g.workspace
     try:
         script_content = request.args.get('script_content')
         if script_content is None:
@@ -137,36 +292,29 @@ def split_case():
         
         decoded_content = urllib.parse.unquote(script_content)
         
-        cleaned_content = re.sub(r'\btestcase\d+:\b', '', decoded_content)
-        processed_content = tessy_manager.clear_all_uuids(cleaned_content)
-        case_content.append(processed_content)
+        # 一次扫描去掉testcase标签、代码块标记, 清空UUID并补齐括号, 保存时不再处理
+        processed_content, errors = sanitize_script(decoded_content)
+        with workspace.lock:
+            workspace.case_content.append_normalized(processed_content)
         
         return jsonify({
             'message': 'Script generated successfully',
-            'processed_content': processed_content
+            'processed_content': processed_content,
+            'errors': errors
         }), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/save_case', methods=['GET'])
 def save_case():
+    workspace = g.workspace
     try:
-        if not case_content:
-            return jsonify({'error': 'No case content to save'}), 400
-        
-        res = '$testobject{\n'
-        for i in case_content:
-            i = re.sub(r'testcase\d+:', '', i)
-            i = tessy_manager.modify_text_style(i)
-            res += i + '\n'
-        res += '}'
-        
-        file_name = f'{test_case}.script'
-        file_path = os.path.join('data', file_name)
-        os.makedirs('data', exist_ok=True)
-        
-        with open(file_path, 'w', encoding='utf-8') as file:
-            file.writelines(res.splitlines(keepends=True))
+        with workspace.lock:
+            if not workspace.case_content:
+                return jsonify({'error': 'No case content to save'}), 400
+            
+            # 片段在追加时已经规范化, 这里只把上次保存之后新增的片段写到文件末尾
+            workspace.case_content.save(workspace.script_path())
         return jsonify({'message': 'Script generated successfully'}), 200
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -174,10 +322,7 @@ def save_case():
 
 def is_tessy_running():
     """检查Tessy是否正在运行"""
-    for proc in psutil.process_iter(['pid', 'name']):
-        if proc.info['name'] == 'TESSY.exe':
-            return True
-    return False
+    return tessy_tracker.is_running()
 
 
 # @app.route('/report_status', methods=['GET'])
@@ -334,6 +479,6 @@ def is_tessy_running():
 
 
 if __name__ == '__main__':
-    app.run(host='0.0.0.0',debug=True, port=5001)
+    app.run(host='0.0.0.0',debug=True, port=5001, threaded=True)
     # print(is_tessy_running())
     # test_with_your_data()
@@ -0,0 +1,145 @@
+"""
+tessycmd的替身, 用于在Linux上测试/压测TessyManager, 不需要安装Tessy
+python fake_tessycmd.py <tessycmd参数...>
+环境变量:
+  FAKE_TESSY_STATE       选择状态文件(每次调用都是新进程, 状态要落盘), 默认在临时目录
+  FAKE_TESSY_CONFIG      项目结构JSON: {"项目": {"测试集合": {"模块": ["测试对象", ...]}}}
+  FAKE_TESSY_LATENCY     每次调用的模拟耗时(秒), 模拟tessycmd的启动开销
+  FAKE_TESSY_LOG         每次调用追加一行命令, 用于统计spawn次数
+  FAKE_TESSY_REPORT_DIR  exec-test时生成XML/TXT报告的目录(TBS文件中reportOutputDirectory是实际路径时优先使用TBS中的目录)
+  FAKE_TESSY_COVERAGE    生成报告的覆盖率, 默认90
+  FAKE_TESSY_EXEC_TIME   exec-test时每个测试对象的模拟执行耗时(秒)
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+import xml.etree.ElementTree as ET
+
+DEFAULT_CONFIG = {
+    'P08593_SCU': {
+        'UnitTest': {
+            'BrsMainStartup': ['Brs_MemoryInit'],
+            'CPUTest': ['CpuTest_AluArith', 'CpuTest_AluLogical'],
+        }
+    }
+}
+
+
+def load_config():
+    path = os.environ.get('FAKE_TESSY_CONFIG')
+    if path:
+        with open(path, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    return DEFAULT_CONFIG
+
+
+def state_path():
+    return os.environ.get('FAKE_TESSY_STATE') or os.path.join(tempfile.gettempdir(), 'fake_tessy_state.json')
+
+
+def load_state():
+    try:
+        with open(state_path(), 'r', encoding='utf-8') as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(state):
+    with open(state_path(), 'w', encoding='utf-8') as file:
+        json.dump(state, file)
+
+
+def fail(message):
+    sys.stderr.write(message + '\n')
+    sys.exit(1)
+
+
+def write_reports(report_dir, test_objects):
+    """为每个测试对象生成XML报告和c0/c1文本报告"""
+    os.makedirs(report_dir, exist_ok=True)
+    coverage = float(os.environ.get('FAKE_TESSY_COVERAGE', '90'))
+    stamp = time.strftime('%Y%m%d_%H%M%S') + f'_{time.time_ns() % 1000000:06d}'
+    for name in test_objects:
+        root = ET.Element('report')
+        testobject = ET.SubElement(root, 'testobject', {'name': name})
+        coverage_element = ET.SubElement(testobject, 'coverage')
+        for tag in ('c0', 'c1', 'dc', 'mcdc'):
+            ET.SubElement(coverage_element, tag, {'percentage': f'{coverage:.2f}'})
+        testcases = ET.SubElement(testobject, 'testcases')
+        ET.SubElement(testcases, 'testcase', {'id': '1', 'result': 'passed'})
+        base = os.path.join(report_dir, f'TESSY_DetailsReport_{name}_{stamp}')
+        ET.ElementTree(root).write(base + '.xml', xml_declaration=True, encoding='utf-8')
+        for tag in ('c0', 'c1'):
+            with open(f'{base}.{tag}.txt', 'w', encoding='utf-8') as file:
+                file.write(f'{name} {tag.upper()} coverage: {coverage:.2f}%\n')
+
+
+def main(argv):
+    if os.environ.get('FAKE_TESSY_LOG'):
+        with open(os.environ['FAKE_TESSY_LOG'], 'a', encoding='utf-8') as file:
+            file.write(' '.join(argv) + '\n')
+    latency = float(os.environ.get('FAKE_TESSY_LATENCY', '0'))
+    if latency:
+        time.sleep(latency)
+    if not argv:
+        fail('missing command')
+
+    config = load_config()
+    state = load_state()
+    command, args = argv[0], argv[1:]
+    project = config.get(state.get('project'), {})
+    collection = project.get(state.get('collection'), {})
+    module = collection.get(state.get('module'), [])
+
+    if command == 'connect':
+        state = {'connected': True}
+    elif not state.get('connected'):
+        fail('not connected')
+    elif command == 'list-projects':
+        print('\n'.join(config))
+    elif command == 'select-project':
+        if args[-1] not in config:
+            fail(f'project not found: {args[-1]}')
+        state = {'connected': True, 'project': args[-1]}
+    elif command == 'list-test-collections':
+        print('\n'.join(project))
+    elif command == 'select-test-collection':
+        if args[-1] not in project:
+            fail(f'test collection not found: {args[-1]}')
+        state.update(collection=args[-1], module=None, test_object=None)
+    elif command == 'list-modules':
+        print('\n'.join(collection))
+    elif command == 'select-module':
+        if args[-1] not in collection:
+            fail(f'module not found: {args[-1]}')
+        state.update(module=args[-1], test_object=None)
+    elif command == 'list-test-objects':
+        print('\n'.join(module))
+    elif command == 'select-test-object':
+        if args[-1] not in module:
+            fail(f'test object not found: {args[-1]}')
+        state.update(test_object=args[-1])
+    elif command == 'import':
+        if not os.path.exists(args[-1]):
+            fail(f'file not found: {args[-1]}')
+    elif command == 'exec-test':
+        tree = ET.parse(args[-1])
+        names = [element.get('name') for element in tree.getroot().iter('testobject')]
+        time.sleep(float(os.environ.get('FAKE_TESSY_EXEC_TIME', '0')) * len(names))
+        report_dir = os.environ.get('FAKE_TESSY_REPORT_DIR')
+        option = tree.getroot().find("operations/operation[@key='generateTestReport']/options/"
+                                     "option[@key='reportOutputDirectory']")
+        if option is not None and '$(' not in option.get('value', '$('):
+            report_dir = option.get('value')
+        if report_dir:
+            write_reports(report_dir, names)
+    else:
+        fail(f'unknown command: {command}')
+    save_state(state)
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
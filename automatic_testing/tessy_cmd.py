@@ -0,0 +1,194 @@
+import os
+import subprocess
+import threading
+import time
+from contextlib import contextmanager
+
+# 选择命令 -> 记录在state里的层级, 选择上层时下层的选择失效
+SELECT_LEVELS = {
+    'select-project': 'project',
+    'select-test-collection': 'collection',
+    'select-module': 'module',
+    'select-test-object': 'test_object',
+}
+LEVEL_ORDER = ('project', 'collection', 'module', 'test_object')
+# 列表命令 -> 结果依赖的选择层级
+LIST_SCOPES = {
+    'list-projects': (),
+    'list-test-collections': ('project',),
+    'list-modules': ('project', 'collection'),
+    'list-test-objects': ('project', 'collection', 'module'),
+}
+
+
+class TessyCommandRunner:
+    """
+    tessycmd调用层
+    - 记录已连接状态和当前选中的项目/测试集合/模块/测试对象, 重复的connect和select直接跳过
+    - 缓存list-*命令的结果, 缓存按选择上下文区分, list_ttl秒后过期, import和exec-test后失效
+    - batch()中排队的命令在退出时合并执行: 同一层级连续的select只保留最后一个, 与当前状态相同的select跳过
+    命令失败时清空所有状态, 下次重新connect
+    env中的环境变量会追加到tessycmd进程的环境中(多个Tessy实例时用来区分实例)
+    """
+
+    def __init__(self, command=('tessycmd',), list_ttl=300, env=None):
+        self.command = list(command)
+        self.list_ttl = list_ttl
+        self.env = dict(os.environ, **env) if env else None
+        self.spawn_count = 0
+        self.connected = False
+        self.state = dict.fromkeys(LEVEL_ORDER)
+        self._list_cache = {}
+        self._pending = None
+        self._lock = threading.RLock()
+
+    def _spawn(self, args):
+        self.spawn_count += 1
+        try:
+            return subprocess.run(self.command + list(args), check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                  env=self.env)
+        except subprocess.CalledProcessError:
+            self.reset()
+            raise
+
+    def reset(self):
+        """清空连接状态和缓存(Tessy重启后调用)"""
+        with self._lock:
+            self.connected = False
+            self.state = dict.fromkeys(LEVEL_ORDER)
+            self._list_cache.clear()
+
+    def reconnect(self):
+        """
+        重新connect, 用来检查Tessy是否还可用: 清空连接和选择状态(Tessy可能已经重启)
+        list-*的缓存保留, 它本来就有list_ttl限制
+        """
+        with self._lock:
+            self.connected = False
+            self.state = dict.fromkeys(LEVEL_ORDER)
+            self.connect()
+
+    def invalidate_lists(self):
+        with self._lock:
+            self._list_cache.clear()
+
+    def connect(self):
+        with self._lock:
+            if not self.connected:
+                self._spawn(['connect'])
+                self.connected = True
+
+    def _select(self, args):
+        level = SELECT_LEVELS[args[0]]
+        name = args[-1]
+        if self.state[level] == name:
+            return
+        self._spawn(args)
+        self.state[level] = name
+        for lower in LEVEL_ORDER[LEVEL_ORDER.index(level) + 1:]:
+            self.state[lower] = None
+
+    def run(self, args):
+        """执行一条tessycmd命令, 返回stdout(str); 在batch中时select命令只排队, 返回空字符串"""
+        args = list(args)
+        with self._lock:
+            if args[0] == 'connect':
+                self.connect()
+                return ''
+            if args[0] in SELECT_LEVELS:
+                if self._pending is not None:
+                    self._pending.append(args)
+                else:
+                    self._select(args)
+                return ''
+            # 其他命令依赖之前的select, 先把排队的命令执行掉
+            self._flush()
+            if args[0] in LIST_SCOPES:
+                return self._list(args)
+            result = self._spawn(args)
+            if args[0] in ('import', 'exec-test'):
+                self._list_cache.clear()
+            return result.stdout.decode('utf-8')
+
+    def _list(self, args):
+        key = (tuple(args),) + tuple(self.state[level] for level in LIST_SCOPES[args[0]])
+        cached = self._list_cache.get(key)
+        if cached is not None and time.monotonic() - cached[1] < self.list_ttl:
+            return cached[0]
+        output = self._spawn(args).stdout.decode('utf-8')
+        self._list_cache[key] = (output, time.monotonic())
+        return output
+
+    def _flush(self):
+        """执行排队的select, 被后面同层或上层选择覆盖的选择直接丢弃"""
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        collapsed = []
+        for args in pending:
+            level = LEVEL_ORDER.index(SELECT_LEVELS[args[0]])
+            collapsed = [queued for queued in collapsed
+                         if LEVEL_ORDER.index(SELECT_LEVELS[queued[0]]) < level]
+            collapsed.append(args)
+        for args in collapsed:
+            self._select(args)
+
+    @contextmanager
+    def batch(self):
+        """在with块中排队select命令, 遇到其他命令或退出时合并执行"""
+        with self._lock:
+            outer = self._pending is not None
+            if not outer:
+                self._pending = []
+            try:
+                yield self
+                self._flush()
+            finally:
+                if not outer:
+                    self._pending = None
+
+
+if __name__ == '__main__':
+    # 用fake_tessycmd.py对比有无状态/列表缓存和测试对象索引时的spawn次数和耗时
+    # python tessy_cmd.py --rounds 10 --latency 0.05
+    import argparse
+    import contextlib
+    import io
+    import shutil
+    import sys
+    import tempfile
+    from tessy_utils import TessyManager
+
+    parser = argparse.ArgumentParser(description='tessycmd spawn benchmark')
+    parser.add_argument('--rounds', type=int, default=10, help='环境配置(project init + 选择测试对象)的次数')
+    parser.add_argument('--latency', type=float, default=0.05, help='fake tessycmd每次调用的模拟耗时(秒)')
+    parser.add_argument('--test-object', default='CpuTest_AluArith')
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp()
+    os.environ['FAKE_TESSY_STATE'] = os.path.join(work_dir, 'state.json')
+    os.environ['FAKE_TESSY_LATENCY'] = str(args.latency)
+    here = os.path.dirname(os.path.abspath(__file__))
+    tbs_file = os.path.join(work_dir, 'batch_test.tbs')
+    shutil.copy(os.path.join(here, 'uploads', 'batch_test.tbs'), tbs_file)
+    fake_command = [sys.executable, os.path.join(here, 'fake_tessycmd.py')]
+
+    try:
+        for mode in ('uncached', 'cached'):
+            runner = TessyCommandRunner(fake_command)
+            manager = TessyManager(tbs_file=tbs_file, report_path=work_dir, cmd=runner,
+                                   object_index_path=os.path.join(work_dir, f'{mode}_index.json'),
+                                   coverage_db_path=os.path.join(work_dir, 'coverage_history.db'))
+            start = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                for _ in range(args.rounds):
+                    if mode == 'uncached':
+                        runner.reset()
+                        manager.object_index.clear()
+                    manager.tessy_project_init()
+                    manager.update_tessy_test_object(args.test_object)
+            elapsed = time.perf_counter() - start
+            print(f'{mode:>9}: {runner.spawn_count:4d} spawns, {elapsed:.2f}s, '
+                  f'{runner.spawn_count / args.rounds:.1f} spawns/round')
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,172 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+
+
+def script_hash(script_path):
+    """测试脚本内容的sha1, 文件不存在时返回None"""
+    try:
+        with open(script_path, 'rb') as file:
+            return hashlib.sha1(file.read()).hexdigest()
+    except OSError:
+        return None
+
+
+class CoverageStore:
+    """
+    覆盖率结果的本地存储(sqlite), 每份XML报告对应一次执行记录
+    - 按 (报告路径, 修改时间, 大小) 识别已经解析过的报告, 不再重复解析
+    - 按 测试对象 + 执行时间 索引, 可查询覆盖率历史, 以及脚本修改前后覆盖率的变化
+    """
+
+    def __init__(self, path='data/coverage_history.db'):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("pragma journal_mode = wal")
+        self._conn.execute(
+            "create table if not exists runs ("
+            "id integer primary key, test_object text, run_at real, script_hash text, "
+            "report_file text, report_mtime real, report_size integer, "
+            "passed integer, failed integer, testcases text, c0_report text, c1_report text, "
+            "unique (report_file, report_mtime, report_size))"
+        )
+        self._conn.execute(
+            "create table if not exists coverage ("
+            "run_id integer, coverage_type text, percentage real, primary key (run_id, coverage_type))"
+        )
+        self._conn.execute(
+            "create table if not exists pruning ("
+            "test_object text, script_hash text, case_coverage text, primary key (test_object, script_hash))"
+        )
+        self._conn.execute("create index if not exists idx_runs_test_object on runs (test_object, run_at)")
+        self._conn.commit()
+
+    @staticmethod
+    def _report_key(report_file):
+        stat = os.stat(report_file)
+        return os.path.abspath(report_file), stat.st_mtime, stat.st_size
+
+    def _details(self, row):
+        run_id, test_object, run_at, hash_value, report_file, testcases = row
+        coverage = dict(self._conn.execute(
+            "select coverage_type, percentage from coverage where run_id = ?", (run_id,)).fetchall())
+        return {
+            'test_object': test_object,
+            'coverage': coverage,
+            'testcases': json.loads(testcases),
+            'run_at': run_at,
+            'script_hash': hash_value,
+            'report': report_file,
+        }
+
+    def lookup(self, report_file, script_hash=None):
+        """已解析过的报告返回记录的结果, 否则返回None; 记录中没有脚本hash时补上"""
+        key = self._report_key(report_file)
+        with self._lock:
+            row = self._conn.execute(
+                "select id, test_object, run_at, script_hash, report_file, testcases from runs "
+                "where report_file = ? and report_mtime = ? and report_size = ?", key).fetchone()
+            if row is None:
+                return None
+            if script_hash and row[3] is None:
+                self._conn.execute("update runs set script_hash = ? where id = ?", (script_hash, row[0]))
+                self._conn.commit()
+                row = row[:3] + (script_hash,) + row[4:]
+            return self._details(row)
+
+    def record(self, report_file, details, script_hash=None):
+        """记录一份报告的解析结果(extract_coverage的返回值), 执行时间取报告的修改时间"""
+        report_path, mtime, size = self._report_key(report_file)
+        verdicts = [testcase['result'] for testcase in details['testcases']]
+        with self._lock:
+            cursor = self._conn.execute(
+                "insert or replace into runs (test_object, run_at, script_hash, report_file, report_mtime, "
+                "report_size, passed, failed, testcases) values (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (details['test_object'], mtime, script_hash, report_path, mtime, size,
+                 verdicts.count('passed'), len(verdicts) - verdicts.count('passed'),
+                 json.dumps(details['testcases'])))
+            self._conn.executemany(
+                "insert or replace into coverage values (?, ?, ?)",
+                [(cursor.lastrowid, name, value) for name, value in details['coverage'].items()])
+            self._conn.commit()
+        return dict(details, run_at=mtime, script_hash=script_hash, report=report_path)
+
+    def attach_txt_reports(self, test_object, report_c0, report_c1):
+        """把c0/c1文本报告记到该测试对象最近一次执行上"""
+        with self._lock:
+            self._conn.execute(
+                "update runs set c0_report = ?, c1_report = ? where id = "
+                "(select id from runs where test_object = ? order by run_at desc limit 1)",
+                (os.path.abspath(report_c0), os.path.abspath(report_c1), test_object))
+            self._conn.commit()
+
+    def pruning_coverage(self, test_object, script_hash):
+        """该脚本删除多余用例时使用的用例覆盖信息 {用例编号: 覆盖条目列表}, 没有记录时返回None"""
+        with self._lock:
+            row = self._conn.execute(
+                "select case_coverage from pruning where test_object = ? and script_hash = ?",
+                (test_object, script_hash)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_pruning_coverage(self, test_object, script_hash, case_coverage):
+        """记录该脚本删除多余用例时使用的用例覆盖信息, 已有记录时保留原来的"""
+        with self._lock:
+            self._conn.execute(
+                "insert or ignore into pruning values (?, ?, ?)",
+                (test_object, script_hash, json.dumps({name: sorted(items) for name, items in case_coverage.items()})))
+            self._conn.commit()
+
+    def history(self, test_object, coverage_type=None):
+        """测试对象的所有执行记录, 按执行时间排序; 指定coverage_type时只返回该类型的覆盖率"""
+        sql = ("select r.id, r.run_at, r.script_hash, r.report_file, r.passed, r.failed, "
+               "r.c0_report, r.c1_report, c.coverage_type, c.percentage "
+               "from runs r left join coverage c on c.run_id = r.id where r.test_object = ?")
+        params = [test_object]
+        if coverage_type:
+            sql += " and c.coverage_type = ?"
+            params.append(coverage_type.upper())
+        sql += " order by r.run_at, r.id"
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        runs = {}
+        for run_id, run_at, hash_value, report_file, passed, failed, c0, c1, name, value in rows:
+            run = runs.setdefault(run_id, {
+                'run_at': run_at, 'script_hash': hash_value, 'report': report_file,
+                'passed': passed, 'failed': failed, 'c0_report': c0, 'c1_report': c1, 'coverage': {},
+            })
+            if name is not None:
+                run['coverage'][name] = value
+        return list(runs.values())
+
+    def compare_scripts(self, test_object, coverage_type='BRANCH'):
+        """
+        最近一次执行与使用不同脚本的上一次执行的覆盖率对比, 回答"这次脚本修改有没有提高C1"
+        没有可对比的记录时返回None
+        """
+        runs = [run for run in self.history(test_object, coverage_type) if run['script_hash']]
+        if not runs:
+            return None
+        current = runs[-1]
+        previous = next((run for run in reversed(runs) if run['script_hash'] != current['script_hash']), None)
+        if previous is None:
+            return None
+        coverage_type = coverage_type.upper()
+        before = previous['coverage'].get(coverage_type)
+        after = current['coverage'].get(coverage_type)
+        return {
+            'coverage_type': coverage_type,
+            'previous': previous,
+            'current': current,
+            'delta': after - before if before is not None and after is not None else None,
+            'improved': before is not None and after is not None and after > before,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,132 @@
+import json
+import os
+import subprocess
+import threading
+import time
+
+
+class TestObjectIndex:
+    """
+    测试对象名 -> (测试集合, 模块) 的索引, 按项目和测试集合保存到磁盘
+    第一次查找时遍历一遍所有模块建立索引, 之后查找不再调用tessycmd;
+    找不到或者索引过期(选择失败)时只重新扫描相关模块
+    """
+
+    def __init__(self, cmd, path='data/test_object_index.json'):
+        self.cmd = cmd
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return {}
+
+    def _save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as file:
+            json.dump(self._entries, file, ensure_ascii=False, indent=2)
+        os.replace(temp_path, self.path)
+
+    def _entry(self):
+        """当前项目和测试集合对应的索引"""
+        key = f"{self.cmd.state['project'] or ''}/{self.cmd.state['collection'] or ''}"
+        return self._entries.setdefault(key, {'objects': {}, 'modules': {}, 'updated_at': None})
+
+    def _list_modules(self):
+        output = self.cmd.run(['list-modules', '-test-collection'])
+        return output.splitlines()
+
+    def _scan_module(self, entry, collection, module):
+        """重新列出一个模块的测试对象, 更新索引"""
+        self.cmd.run(['select-module', '-test-collection', module])
+        test_objects = self.cmd.run(['list-test-objects']).splitlines()
+        for name in entry['modules'].get(module, []):
+            if entry['objects'].get(name) == [collection, module]:
+                del entry['objects'][name]
+        for name in test_objects:
+            entry['objects'][name] = [collection, module]
+        entry['modules'][module] = test_objects
+
+    def refresh(self, modules=None):
+        """重新扫描指定模块(默认全部模块), 并删除已经不存在的模块"""
+        with self._lock:
+            entry = self._entry()
+            collection = self.cmd.state['collection']
+            all_modules = self._list_modules()
+            for module in list(entry['modules']):
+                if module not in all_modules:
+                    for name in entry['modules'].pop(module):
+                        if entry['objects'].get(name, [None, None])[1] == module:
+                            del entry['objects'][name]
+            for module in modules if modules is not None else all_modules:
+                if module in all_modules:
+                    self._scan_module(entry, collection, module)
+            entry['updated_at'] = time.time()
+            self._save()
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+            self._save()
+
+    def lookup(self, test_object_name):
+        """返回(测试集合, 模块), 不在索引中时返回None"""
+        with self._lock:
+            location = self._entry()['objects'].get(test_object_name)
+        return tuple(location) if location else None
+
+    def find(self, test_object_name):
+        """
+        查找测试对象所在模块: 先查索引; 未命中时扫描还没有索引过的模块,
+        仍未找到再完整重扫一次(模块内容可能已经变化)
+        """
+        location = self.lookup(test_object_name)
+        if location is not None:
+            return location
+        with self._lock:
+            indexed = set(self._entry()['modules'])
+        new_modules = [module for module in self._list_modules() if module not in indexed]
+        if new_modules:
+            self.refresh(new_modules)
+            location = self.lookup(test_object_name)
+            if location is not None:
+                return location
+        self.refresh()
+        return self.lookup(test_object_name)
+
+    def select(self, test_object_name):
+        """
+        选中测试对象, 返回所在模块; 找不到返回None
+        索引过期导致选择失败时, 重扫该模块后再试一次
+        """
+        for attempt in range(2):
+            location = self.find(test_object_name)
+            if location is None:
+                return None
+            collection, module = location
+            project = self.cmd.state['project']
+            try:
+                # 两个选择排队后一起执行, 与当前状态相同的选择直接跳过
+                with self.cmd.batch():
+                    self.cmd.run(['select-module', '-test-collection', module])
+                    self.cmd.run(['select-test-object', test_object_name])
+                return module
+            except subprocess.CalledProcessError:
+                if attempt:
+                    raise
+                # 选择失败会清空tessycmd的状态, 恢复项目和测试集合的选择后只重扫这个模块
+                self.cmd.connect()
+                with self.cmd.batch():
+                    if project:
+                        self.cmd.run(['select-project', project])
+                    if collection:
+                        self.cmd.run(['select-test-collection', collection])
+                self.refresh([module])
+        return None
@@ -0,0 +1,174 @@
+import os
+import queue
+import shutil
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+
+from tessy_coverage import script_hash
+from tessy_utils import TessyManager
+
+QUEUED = 'queued'
+IMPORTING = 'importing'
+EXECUTING = 'executing'
+REPORTING = 'reporting'
+DONE = 'done'
+FAILED = 'failed'
+FINISHED_STATES = (DONE, FAILED)
+
+
+class TessyJob:
+    def __init__(self, job_id, test_case, script_path, prune_covered=False, script_hash=None):
+        self.job_id = job_id
+        self.test_case = test_case
+        self.script_path = script_path
+        self.script_hash = script_hash
+        self.prune_covered = prune_covered
+        self.removed_cases = []
+        self.state = QUEUED
+        self.error = None
+        self.report = None
+        self.coverage_ok = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.version = 0
+
+    def to_dict(self):
+        return {
+            'job_id': self.job_id,
+            'test_case': self.test_case,
+            'state': self.state,
+            'error': self.error,
+            'report': self.report,
+            'coverage_ok': self.coverage_ok,
+            'removed_cases': self.removed_cases,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+
+
+class TessyJobQueue:
+    """
+    Tessy 执行任务队列
+    提交后立即返回 job_id, 由唯一的后台线程按顺序执行, 保证同一时间只有一个任务在使用 Tessy
+    """
+
+    def __init__(self, tessy_manager: TessyManager, report_timeout=600, max_finished=200,
+                 backend_lock: Optional[threading.RLock] = None):
+        self.tessy_manager = tessy_manager
+        self.report_timeout = report_timeout
+        self.max_finished = max_finished
+        self.backend_lock = backend_lock or threading.RLock()
+        self._jobs: Dict[str, TessyJob] = {}
+        self._finished_order: List[str] = []
+        self._queue = queue.Queue()
+        self._cond = threading.Condition()
+        self._worker = threading.Thread(target=self._run, name='tessy-job-worker', daemon=True)
+        self._worker.start()
+
+    def submit(self, test_case, script_path, prune_covered=False):
+        """
+        提交执行任务, 返回任务对象; prune_covered见TessyManager.dedupe_test_script
+        脚本在提交时复制到 jobs/<job_id>/ 下, 之后工作区里的脚本被覆盖也不影响这个任务
+        """
+        job_id = uuid.uuid4().hex
+        job_dir = os.path.join(os.path.dirname(script_path), 'jobs', job_id)
+        os.makedirs(job_dir, exist_ok=True)
+        snapshot = os.path.join(job_dir, os.path.basename(script_path))
+        shutil.copyfile(script_path, snapshot)
+        job = TessyJob(job_id, test_case, snapshot, prune_covered, script_hash(snapshot))
+        with self._cond:
+            self._jobs[job.job_id] = job
+        self._queue.put(job.job_id)
+        return job
+
+    def get(self, job_id) -> Optional[TessyJob]:
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def position(self, job_id):
+        """排队中任务前面还有几个任务"""
+        with self._cond:
+            queued = [j for j in self._jobs.values() if j.state == QUEUED]
+        queued.sort(key=lambda j: j.created_at)
+        for index, job in enumerate(queued):
+            if job.job_id == job_id:
+                return index
+        return None
+
+    def wait(self, job_id, timeout=30, since_version=None):
+        """
+        长轮询: 等待任务状态发生变化(或结束), 最多等 timeout 秒
+        since_version 为客户端上次看到的版本号, 不传时只等待任务结束
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            job = self._jobs.get(job_id)
+            while job is not None and job.state not in FINISHED_STATES:
+                if since_version is not None and job.version != since_version:
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return job
+
+    def _set_state(self, job, state, **fields):
+        with self._cond:
+            job.state = state
+            for key, value in fields.items():
+                setattr(job, key, value)
+            job.version += 1
+            if state in FINISHED_STATES:
+                job.finished_at = time.time()
+                self._finished_order.append(job.job_id)
+                # 只保留最近 max_finished 个已结束任务
+                while len(self._finished_order) > self.max_finished:
+                    self._jobs.pop(self._finished_order.pop(0), None)
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            job_id = self._queue.get()
+            job = self.get(job_id)
+            if job is None:
+                continue
+            try:
+                with self.backend_lock:
+                    self._execute(job)
+            except Exception as e:
+                self._set_state(job, FAILED, error=f'Unexpected error: {str(e)}')
+            finally:
+                shutil.rmtree(os.path.dirname(job.script_path), ignore_errors=True)
+
+    def _execute(self, job):
+        self._set_state(job, IMPORTING, started_at=time.time())
+        # 其他客户端可能在排队期间调用了/set_env, 执行前重新选中本任务的测试对象并写TBS文件
+        if not self.tessy_manager.tessy_project_init():
+            self._set_state(job, FAILED, error='Failed to initialize Tessy project')
+            return
+        if not self.tessy_manager.update_tessy_test_object(job.test_case):
+            self._set_state(job, FAILED, error=f"Failed to select test object '{job.test_case}'")
+            return
+        import_path, job.removed_cases = self.tessy_manager.dedupe_test_script(
+            job.script_path, job.test_case, job.prune_covered, job.script_hash)
+        if not self.tessy_manager.import_test_script(import_path):
+            self._set_state(job, FAILED, error='Failed to import test case')
+            return
+
+        self._set_state(job, EXECUTING)
+        if not self.tessy_manager.exec_test():
+            self._set_state(job, FAILED, error='Failed to execute test case')
+            return
+
+        self._set_state(job, REPORTING)
+        report = self.tessy_manager.wait_for_report(job.test_case, since=job.started_at,
+                                                    timeout=self.report_timeout)
+        if report is None:
+            self._set_state(job, FAILED, error=f"No matching XML report found for test case '{job.test_case}'")
+            return
+        self._set_state(job, DONE, report=report,
+                        coverage_ok=self.tessy_manager.check_report_coverage(report, job.script_hash))
@@ -0,0 +1,90 @@
+import threading
+import time
+
+import psutil
+
+
+class ProcessTracker:
+    """
+    记录Tessy进程的PID, 检查是否运行时直接查这个PID(O(1))
+    PID未知或进程已退出时才按进程名扫描一次所有进程, 找到后记住它的PID
+    """
+
+    def __init__(self, process_name='TESSY.exe'):
+        self.process_name = process_name.lower()
+        self._process = None
+        self._lock = threading.Lock()
+
+    def track(self, pid):
+        """记录我们启动的进程, 启动器进程名不匹配时会在它的子进程中查找"""
+        try:
+            process = psutil.Process(pid)
+        except psutil.NoSuchProcess:
+            return False
+        with self._lock:
+            self._process = process
+        return True
+
+    @property
+    def pid(self):
+        process = self._process
+        return process.pid if process is not None else None
+
+    def _matches(self, process):
+        try:
+            return process.is_running() and process.status() != psutil.STATUS_ZOMBIE \
+                and process.name().lower() == self.process_name
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            return False
+
+    def _resolve(self):
+        """返回当前的Tessy进程, 没有则返回None"""
+        process = self._process
+        if process is not None:
+            if self._matches(process):
+                return process
+            try:
+                # is_running()会校验进程创建时间, PID被系统复用时不会误判
+                if process.is_running():
+                    for child in process.children(recursive=True):
+                        if self._matches(child):
+                            with self._lock:
+                                self._process = child
+                            return child
+                    return None
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                pass
+        return self._scan()
+
+    def _scan(self):
+        for proc in psutil.process_iter(['name']):
+            name = proc.info['name']
+            if name and name.lower() == self.process_name:
+                with self._lock:
+                    self._process = proc
+                return proc
+        with self._lock:
+            self._process = None
+        return None
+
+    def is_running(self):
+        return self._resolve() is not None
+
+    def health(self):
+        """进程健康信息"""
+        process = self._resolve()
+        if process is None:
+            return {'running': False, 'pid': None}
+        try:
+            with process.oneshot():
+                return {
+                    'running': True,
+                    'pid': process.pid,
+                    'status': process.status(),
+                    'uptime': time.time() - process.create_time(),
+                    'memory_rss': process.memory_info().rss,
+                    'cpu_percent': process.cpu_percent(interval=None),
+                    'num_threads': process.num_threads(),
+                }
+        except (psutil.NoSuchProcess, psutil.AccessDenied) as e:
+            return {'running': False, 'pid': process.pid, 'error': str(e)}
@@ -0,0 +1,333 @@
+import json
+import os
+import threading
+import time
+import xml.etree.ElementTree as ET
+import zlib
+from collections import OrderedDict
+
+REPORT_KINDS = ('xml', 'c0', 'c1')
+# batch_test.tbs中reportFileNamePattern的固定前缀, 之后是测试对象名
+REPORT_PREFIX = 'TESSY_DetailsReport_'
+STREAM_CHUNK_SIZE = 64 * 1024
+# 报告里覆盖率元素的名字 -> batch_test.tbs中coverageType的名字
+COVERAGE_ALIASES = {'C0': 'STATEMENT', 'C1': 'BRANCH', 'DC': 'DECISION', 'MC/DC': 'MCDC'}
+
+
+def report_kind(name):
+    """按文件名判断报告类型, 不是报告时返回None"""
+    if name.endswith('.c0.txt'):
+        return 'c0'
+    if name.endswith('.c1.txt'):
+        return 'c1'
+    if name.endswith('.xml') and not name.endswith('.notes.xml'):
+        return 'xml'
+    return None
+
+
+def report_matches(name, case_name):
+    """
+    报告文件名是否属于该测试对象
+    TESSY_DetailsReport_<测试对象>_...的文件名要求测试对象名完整匹配(M_F1不匹配M_F11的报告), 其他文件名按包含判断
+    """
+    if name.startswith(REPORT_PREFIX):
+        rest = name[len(REPORT_PREFIX):]
+        return rest.startswith(case_name) and rest[len(case_name):len(case_name) + 1] in ('_', '.')
+    return case_name in name
+
+
+def tbs_coverage_types(tbs_file):
+    """batch_test.tbs中配置的覆盖率类型, 如 ['DECISION', 'STATEMENT', 'BRANCH', 'MCDC']"""
+    return [element.get('name').upper() for element in ET.parse(tbs_file).getroot().iter('coverageType')]
+
+
+def coverage_name(element):
+    name = (element.get('name') or element.get('type') or element.tag).upper()
+    return COVERAGE_ALIASES.get(name, name)
+
+
+def extract_coverage(report_file, coverage_types=None, with_testcases=True):
+    """
+    流式读取XML报告, 一次遍历得到测试对象名、各类型覆盖率和每个测试用例的结果
+    返回 {'test_object': 名称, 'coverage': {'STATEMENT': 90.0, ...}, 'testcases': [{'id': .., 'result': ..}]}
+    测试用例下有 <coverage> 时, 其中带id的元素作为该用例覆盖的条目, 记在 'covered' 中(如 'branch:b3')
+    - 读完的元素立即从父元素删除, 几百MB的报告内存占用也不会随文件增大
+    - 覆盖率和测试用例(with_testcases=False时只要覆盖率)都读到后立即停止, 不读剩下的部分
+    - coverage_types不为None时只返回其中的类型
+    """
+    wanted = {name.upper() for name in coverage_types} if coverage_types is not None else None
+    result = {'test_object': None, 'coverage': {}, 'testcases': []}
+    coverage_done = testcases_done = False
+    covered = None
+    case_coverage_depth = 0
+    stack = []
+    with open(report_file, 'rb') as file:
+        for event, element in ET.iterparse(file, events=('start', 'end')):
+            if event == 'start':
+                if element.tag == 'testobject' and result['test_object'] is None:
+                    result['test_object'] = element.get('name')
+                elif element.tag == 'testcase':
+                    covered = []
+                elif element.tag == 'coverage' and covered is not None:
+                    case_coverage_depth += 1
+                stack.append(element)
+                continue
+            stack.pop()
+            parent = stack[-1] if stack else None
+            if covered is not None and element.tag != 'testcase':
+                # 测试用例内部的元素, 只收集覆盖条目
+                if element.tag == 'coverage':
+                    case_coverage_depth -= 1
+                elif case_coverage_depth and element.get('id') is not None:
+                    covered.append(f"{element.tag}:{element.get('id')}")
+            elif parent is not None and parent.tag == 'coverage' and not coverage_done:
+                name = coverage_name(element)
+                percentage = element.get('percentage')
+                if percentage is not None and (wanted is None or name in wanted):
+                    result['coverage'][name] = float(percentage)
+            elif element.tag == 'coverage':
+                coverage_done = True
+            elif element.tag == 'testcase':
+                if with_testcases and not testcases_done:
+                    testcase = {'id': element.get('id'), 'result': element.get('result')}
+                    if covered:
+                        testcase['covered'] = covered
+                    result['testcases'].append(testcase)
+                covered = None
+            elif element.tag == 'testcases':
+                testcases_done = True
+            if coverage_done and (testcases_done or not with_testcases or element.tag == 'testobject'):
+                break
+            if parent is not None:
+                parent.remove(element)
+            element.clear()
+    return result
+
+
+class ReportIndex:
+    """
+    报告目录索引, 代替每次调用都glob整个目录再逐个getmtime
+    - 用os.scandir增量扫描(Windows上scandir自带修改时间, 不需要再逐个stat)
+    - 目录修改时间没变且距上次完整扫描不到rescan_interval秒时不扫描
+      (新建/删除文件会改变目录修改时间, 原地覆盖的报告最迟rescan_interval秒后被发现)
+    - 按 (报告类型, 测试对象名) 缓存最新的报告, 增量扫描发现新文件时只更新受影响的缓存
+    - 可选 start_watcher() 在后台线程定期扫描, 查询时就不用等扫描
+    """
+
+    def __init__(self, report_path, rescan_interval=30.0):
+        self.report_path = report_path
+        self.rescan_interval = rescan_interval
+        self._entries = {kind: {} for kind in REPORT_KINDS}
+        self._latest = {}
+        self._dir_mtime = None
+        self._scanned_at = 0.0
+        self._lock = threading.RLock()
+        self._watcher = None
+        self._stop = threading.Event()
+
+    def rescan(self):
+        """扫描目录, 把新增/修改/删除的文件合并进索引"""
+        try:
+            dir_mtime = os.stat(self.report_path).st_mtime
+            scanned = {kind: {} for kind in REPORT_KINDS}
+            with os.scandir(self.report_path) as entries:
+                for entry in entries:
+                    kind = report_kind(entry.name)
+                    if kind is None:
+                        continue
+                    try:
+                        scanned[kind][entry.name] = (entry.stat().st_mtime, entry.path)
+                    except FileNotFoundError:
+                        continue
+        except FileNotFoundError:
+            dir_mtime = None
+            scanned = {kind: {} for kind in REPORT_KINDS}
+
+        with self._lock:
+            for kind in REPORT_KINDS:
+                old, new = self._entries[kind], scanned[kind]
+                removed = old.keys() - new.keys()
+                changed = [name for name, value in new.items() if old.get(name) != value]
+                if removed:
+                    removed_paths = {old[name][1] for name in removed}
+                    for key in [key for key, value in self._latest.items()
+                                if key[0] == kind and value[1] in removed_paths]:
+                        del self._latest[key]
+                for name in changed:
+                    mtime, path = new[name]
+                    for key, value in list(self._latest.items()):
+                        if key[0] == kind and report_matches(name, key[1]) and mtime >= value[0]:
+                            self._latest[key] = (mtime, path)
+                self._entries[kind] = new
+            self._dir_mtime = dir_mtime
+            self._scanned_at = time.monotonic()
+
+    def _refresh_if_stale(self):
+        try:
+            dir_mtime = os.stat(self.report_path).st_mtime
+        except FileNotFoundError:
+            dir_mtime = None
+        if dir_mtime != self._dir_mtime or time.monotonic() - self._scanned_at > self.rescan_interval:
+            self.rescan()
+
+    def _find(self, kind, case_name):
+        with self._lock:
+            cached = self._latest.get((kind, case_name))
+            if cached is not None:
+                return cached[1]
+            candidates = [value for name, value in self._entries[kind].items() if report_matches(name, case_name)]
+            if not candidates:
+                return None
+            latest = max(candidates)
+            self._latest[(kind, case_name)] = latest
+            return latest[1]
+
+    def latest(self, kind, case_name):
+        """测试对象最新的报告路径, 没有时返回None"""
+        if self._watcher is None:
+            self._refresh_if_stale()
+        return self._find(kind, case_name)
+
+    def reports(self, kind, case_name):
+        """测试对象的所有报告 [(修改时间, 路径)], 最新的在前"""
+        if self._watcher is None:
+            self._refresh_if_stale()
+        with self._lock:
+            return sorted((value for name, value in self._entries[kind].items() if report_matches(name, case_name)),
+                          reverse=True)
+
+    def start_watcher(self, interval=2.0):
+        """后台线程每interval秒增量扫描一次"""
+        if self._watcher is not None:
+            return
+        self.rescan()
+
+        def watch():
+            while not self._stop.wait(interval):
+                try:
+                    self._refresh_if_stale()
+                except OSError as e:
+                    print(f"Error scanning report directory: {e}")
+
+        self._watcher = threading.Thread(target=watch, name='report-index-watcher', daemon=True)
+        self._watcher.start()
+
+    def stop_watcher(self):
+        self._stop.set()
+        self._watcher = None
+
+
+def iter_file(path, chunk_size=STREAM_CHUNK_SIZE):
+    """按块读取文件, 用于流式响应"""
+    with open(path, 'rb') as file:
+        while True:
+            chunk = file.read(chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
+def iter_gzip(chunks, level=6):
+    """把数据块流式压缩成gzip格式"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def iter_json_object(fields, chunk_size=STREAM_CHUNK_SIZE):
+    """
+    流式生成 {"字段": "文件内容", ...} 形式的JSON, fields是(字段名, 文件路径)列表
+    文件按块读取并分别转义, 拼起来与json.dumps整个内容的结果等价
+    文件在调用时就全部打开, 打不开时异常在返回响应之前抛出; 无效的UTF-8字节按替换字符输出, 不会中途出错
+    """
+    files = []
+    try:
+        for name, path in fields:
+            files.append((name, open(path, 'r', encoding='utf-8', errors='replace')))
+    except OSError:
+        for _, file in files:
+            file.close()
+        raise
+    return _iter_json_fields(files, chunk_size)
+
+
+def _iter_json_fields(files, chunk_size):
+    try:
+        yield b'{'
+        for i, (name, file) in enumerate(files):
+            prefix = ', ' if i else ''
+            yield f'{prefix}{json.dumps(name)}: "'.encode('utf-8')
+            while True:
+                text = file.read(chunk_size)
+                if not text:
+                    break
+                yield json.dumps(text)[1:-1].encode('utf-8')
+            yield b'"'
+        yield b'}'
+    finally:
+        for _, file in files:
+            file.close()
+
+
+class LineWindowReader:
+    """
+    按行窗口读取大文本报告
+    第一次读取某个文件时扫描一遍, 每step行记录一次字节偏移; 之后翻页直接seek到最近的记录点
+    索引按 (修改时间, 大小) 校验, 最多缓存max_files个文件
+    """
+
+    def __init__(self, step=1000, max_files=32):
+        self.step = step
+        self.max_files = max_files
+        self._indexes = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _build(self, path):
+        offsets = [0]
+        total = 0
+        position = 0
+        with open(path, 'rb') as file:
+            for line in file:
+                total += 1
+                position += len(line)
+                if total % self.step == 0:
+                    offsets.append(position)
+        return offsets, total
+
+    def _index(self, path):
+        stat = os.stat(path)
+        key = (stat.st_mtime, stat.st_size)
+        with self._lock:
+            cached = self._indexes.get(path)
+            if cached is not None and cached[0] == key:
+                self._indexes.move_to_end(path)
+                return cached[1], cached[2]
+        offsets, total = self._build(path)
+        with self._lock:
+            self._indexes[path] = (key, offsets, total)
+            self._indexes.move_to_end(path)
+            while len(self._indexes) > self.max_files:
+                self._indexes.popitem(last=False)
+        return offsets, total
+
+    def read(self, path, start=0, count=500):
+        """返回 (从第start行开始的最多count行, 文件总行数), 行号从0开始"""
+        offsets, total = self._index(path)
+        start = max(0, start)
+        lines = []
+        if start >= total or count <= 0:
+            return lines, total
+        with open(path, 'rb') as file:
+            checkpoint = start // self.step
+            file.seek(offsets[checkpoint])
+            for _ in range(start - checkpoint * self.step):
+                file.readline()
+            for _ in range(count):
+                line = file.readline()
+                if not line:
+                    break
+                lines.append(line.decode('utf-8', errors='replace').rstrip('\r\n'))
+        return lines, total
@@ -0,0 +1,455 @@
+import hashlib
+import itertools
+import os
+import re
+
+# 需要处理的记号, 用split一次切开: 结果中奇数位置是记号, 偶数位置是原样保留的普通文本
+# ''' 桩函数体、字符串和$uuid的值整体作为一个记号, 其中的括号不参与配对
+# 普通文本中的括号最后一起检查: 只保留括号后反复删除'{}', 剩下的就是不配对的括号
+SCRIPT_TOKEN = re.compile(r'''(
+    ```(?:plaintext|c)?
+  | \'\'\'.*?(?:\'\'\'|\Z)
+  | \$uuid(?:[ \t]+(?:"[^"\n]*"|[^\s{}"]+))?
+  | "(?:[^"\\\n]|\\.)*(?:"|$)
+  | testcase\d+:
+)''', re.VERBOSE | re.DOTALL | re.MULTILINE)
+BRACE = re.compile(r'[{}]')
+# 用bytes.translate删掉括号以外的字节(UTF-8多字节字符里不会出现括号的字节)
+NOT_BRACE_BYTES = bytes(byte for byte in range(256) if byte not in b'{}')
+
+
+def line_of(text, position):
+    return text.count('\n', 0, position) + 1
+
+
+def brace_errors(text, protected):
+    """逐个检查括号(跳过protected中的区间), 返回 (多余的'}'的位置, 未闭合的'{'的位置)"""
+    unmatched = []
+    open_braces = []
+    spans = iter(protected)
+    span = next(spans, None)
+    for match in BRACE.finditer(text):
+        position = match.start()
+        while span is not None and span[1] <= position:
+            span = next(spans, None)
+        if span is not None and span[0] <= position:
+            continue
+        if match.group() == '{':
+            open_braces.append(position)
+        elif open_braces:
+            open_braces.pop()
+        else:
+            unmatched.append(position)
+    return unmatched, open_braces
+
+
+def token_spans(parts):
+    """SCRIPT_TOKEN.split的结果中各记号在原文中的 (开始, 结束) 位置"""
+    offsets = [0, *itertools.accumulate(map(len, parts))]
+    return [(offsets[i], offsets[i + 1]) for i in range(1, len(parts), 2)]
+
+
+def sanitize_script(text, strip_fences=True, strip_labels=True, clear_uuids=True, balance_braces=True):
+    """
+    一次扫描完成脚本文本的清理, 返回 (清理后的文本, 结构错误列表)
+    - strip_fences: 去掉 ```plaintext / ```c / ``` 代码块标记
+    - strip_labels: 去掉 testcase1: 这样的标签
+    - clear_uuids: $uuid 的值统一替换为 "" (没有值时补上 "")
+    - balance_braces: 末尾补齐未闭合的 '{'
+    ''' 桩函数体和字符串中的括号不参与配对; 多余的 '}'、未闭合的 '{'、'''和字符串都会记录在错误列表中
+    """
+    parts = SCRIPT_TOKEN.split(text)
+    pieces = list(parts)
+    unterminated = []
+    for i in range(1, len(parts), 2):
+        token = parts[i]
+        first = token[0]
+        if first == '"':
+            if len(token) < 2 or token[-1] != '"':
+                unterminated.append((i, 'string'))
+        elif first == "'":
+            if len(token) < 6 or not token.endswith("'''"):
+                unterminated.append((i, "''' block"))
+        elif first == '$':
+            if clear_uuids:
+                pieces[i] = '$uuid ""'
+        elif first == 't':
+            if strip_labels:
+                pieces[i] = ''
+        elif strip_fences:
+            pieces[i] = ''
+
+    errors = []
+    spans = None
+    if unterminated:
+        spans = token_spans(parts)
+        errors.extend(f"line {line_of(text, spans[i // 2][0])}: unterminated {what}" for i, what in unterminated)
+
+    braces = ''.join(parts[0::2]).encode('utf-8').translate(None, NOT_BRACE_BYTES)
+    while b'{}' in braces:
+        braces = braces.replace(b'{}', b'')
+    balance = 0
+    if braces:
+        unmatched, open_braces = brace_errors(text, spans or token_spans(parts))
+        errors.extend(f"line {line_of(text, position)}: unmatched '}}'" for position in unmatched)
+        errors.extend(f"line {line_of(text, position)}: unclosed '{{'" for position in open_braces)
+        balance = len(open_braces)
+    if balance_braces and balance:
+        pieces.append('\n}\n' * balance)
+    return ''.join(pieces), errors
+
+
+def normalize_fragment(chunk, clear_uuids=False):
+    """保存前对一个用例片段做的处理: 去掉testcase标签和代码块标记并补齐括号"""
+    return sanitize_script(chunk, clear_uuids=clear_uuids)[0] + '\n'
+
+
+def encode_text(text):
+    """与文本模式写文件相同的换行转换和编码"""
+    return text.replace('\n', os.linesep).encode('utf-8')
+
+
+class ScriptBuilder:
+    """
+    $testobject{...} 脚本的增量拼接
+    - 片段到达时规范化一次, 之后只保存规范化后的片段列表
+    - 保存时只追加上次写入之后新增的片段并重写结尾的 '}'
+      文件被其他地方改写过(大小或修改时间对不上)或换了路径时才整体重写
+    """
+
+    HEADER = '$testobject{\n'
+    FOOTER = '}'
+
+    def __init__(self):
+        self.fragments = []
+        self._written = None
+
+    def __len__(self):
+        return len(self.fragments)
+
+    def append(self, chunk):
+        self.fragments.append(normalize_fragment(chunk))
+
+    def append_normalized(self, fragment):
+        """追加已经用sanitize_script处理过的片段"""
+        self.fragments.append(fragment + '\n')
+
+    def clear(self):
+        self.fragments = []
+        self._written = None
+
+    def text(self):
+        return self.HEADER + ''.join(self.fragments) + self.FOOTER
+
+    def _can_append(self, path):
+        written = self._written
+        if written is None or written['path'] != path or written['count'] > len(self.fragments):
+            return False
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        return stat.st_size == written['size'] and stat.st_mtime_ns == written['mtime_ns']
+
+    def save(self, path):
+        """写入脚本文件, 返回本次写入的字节数"""
+        footer = encode_text(self.FOOTER)
+        if self._can_append(path):
+            start = self._written['count']
+            with open(path, 'r+b') as file:
+                file.seek(self._written['tail'])
+                for fragment in self.fragments[start:]:
+                    file.write(encode_text(fragment))
+                tail = file.tell()
+                file.write(footer)
+                file.truncate()
+            written = tail - self._written['tail'] + len(footer)
+        else:
+            with open(path, 'wb') as file:
+                file.write(encode_text(self.HEADER))
+                for fragment in self.fragments:
+                    file.write(encode_text(fragment))
+                tail = file.tell()
+                file.write(footer)
+            written = tail + len(footer)
+        stat = os.stat(path)
+        self._written = {
+            'path': path,
+            'count': len(self.fragments),
+            'tail': tail,
+            'size': stat.st_size,
+            'mtime_ns': stat.st_mtime_ns,
+        }
+        return written
+
+
+# 语法树解析时需要识别的记号: 先跳过普通文本(包括不含括号的字符串, 用前瞻+反向引用实现不回溯), 再匹配一个记号
+# ''' 桩函数体和字符串中的括号不算块的开始和结束
+STRUCTURE_TOKEN = re.compile(r'''
+    (?=(?P<skip>(?:[^'"{}]+|"[^"\\\n{}]*"|'(?!''))*))(?P=skip)
+    (?:
+        \'\'\'.*?(?:\'\'\'|\Z)
+      | "(?:[^"\\\n]|\\.)*(?:"|$)
+      | (?P<brace>[{}])
+      | \Z
+    )
+''', re.VERBOSE | re.DOTALL | re.MULTILINE)
+BLOCK_HEAD = re.compile(r'\$(\w+)\s*([^$]*?)\s*\{\Z')
+
+
+class ScriptSyntaxError(ValueError):
+    pass
+
+
+class ScriptNode:
+    """
+    脚本语法树的一个块: head是从块名到 '{' 的原文, children是原文片段(str)和子块, tail是 '}'
+    $testobject/$testcase/$teststep/$inputs/$outputs/$stubfunctions/$calltrace 等块的kind是去掉$的名字,
+    name是块名后面的部分(如testcase的编号 "1", teststep的编号 "1.1"); 其他块(如 &target_PtrA {)的kind为'block'
+    所有原文都保存在树里, to_text()得到与解析前逐字节相同的文本
+    """
+
+    __slots__ = ('kind', 'name', 'head', 'children', 'tail')
+
+    def __init__(self, kind, name='', head='', children=None, tail=''):
+        self.kind = kind
+        self.name = name
+        self.head = head
+        self.children = children if children is not None else []
+        self.tail = tail
+
+    @classmethod
+    def from_head(cls, head):
+        match = BLOCK_HEAD.search(head)
+        if match:
+            return cls(match.group(1), match.group(2), head)
+        return cls('block', head[:-1].strip(), head)
+
+    def __repr__(self):
+        return f'ScriptNode({self.kind!r}, {self.name!r}, {len(self.children)} children)'
+
+    def blocks(self, kind=None):
+        """直接子块, 可按kind过滤"""
+        return [child for child in self.children
+                if isinstance(child, ScriptNode) and (kind is None or child.kind == kind)]
+
+    def find(self, kind):
+        """深度优先找到的第一个kind块, 没有返回None"""
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if node.kind == kind and node is not self:
+                return node
+            stack.extend(reversed(node.blocks()))
+        return None
+
+    def remove(self, node):
+        """删除子块, 连同它前面那段只有空白的原文, 避免留下空行"""
+        index = next(i for i, child in enumerate(self.children) if child is node)
+        if index > 0 and isinstance(self.children[index - 1], str) and not self.children[index - 1].strip():
+            del self.children[index - 1:index + 1]
+        else:
+            del self.children[index]
+
+    def _write(self, parts):
+        stack = [self]
+        while stack:
+            item = stack.pop()
+            if isinstance(item, str):
+                parts.append(item)
+                continue
+            parts.append(item.head)
+            stack.append(item.tail)
+            stack.extend(reversed(item.children))
+
+    def inner_text(self):
+        """块内的原文(不含head和tail)"""
+        parts = []
+        for child in self.children:
+            if isinstance(child, str):
+                parts.append(child)
+            else:
+                child._write(parts)
+        return ''.join(parts)
+
+    def to_text(self):
+        parts = []
+        self._write(parts)
+        return ''.join(parts)
+
+
+def parse_script(text, strict=True):
+    """
+    把Tessy脚本解析成语法树, 返回kind为'root'的根节点
+    strict为False时, 多余的 '}' 当作原文保留, 未闭合的块在文本末尾结束(tail为空), 序列化结果仍与原文相同
+    strict为True时这两种情况抛出ScriptSyntaxError
+    """
+    root = ScriptNode('root')
+    stack = [root]
+    starts = [0]
+    position = 0
+    for match in STRUCTURE_TOKEN.finditer(text):
+        brace = match.group('brace')
+        if brace is None:
+            continue
+        start = match.start('brace')
+        node = stack[-1]
+        if brace == '{':
+            # 块名从 '{' 所在行的第一个非空白字符开始
+            head_start = text.rfind('\n', position, start) + 1 or position
+            while head_start < start and text[head_start] in ' \t':
+                head_start += 1
+            if head_start > position:
+                node.children.append(text[position:head_start])
+            child = ScriptNode.from_head(text[head_start:start + 1])
+            node.children.append(child)
+            stack.append(child)
+            starts.append(head_start)
+        elif len(stack) > 1:
+            if start > position:
+                node.children.append(text[position:start])
+            node.tail = '}'
+            stack.pop()
+            starts.pop()
+        elif strict:
+            raise ScriptSyntaxError(f"line {line_of(text, start)}: unmatched '}}'")
+        else:
+            node.children.append(text[position:start + 1])
+        position = start + 1
+    if len(stack) > 1 and strict:
+        raise ScriptSyntaxError(f"line {line_of(text, starts[-1])}: unclosed '{stack[-1].head}'")
+    if position < len(text):
+        stack[-1].children.append(text[position:])
+    return root
+
+
+def canonical_block(node):
+    """块内容的规范形式: 去掉每行首尾空白、空行以及$name/$uuid行, 与编号和排版无关"""
+    lines = []
+    for line in node.inner_text().splitlines():
+        line = line.strip()
+        if line and not line.startswith(('$name', '$uuid')):
+            lines.append(line)
+    return '\n'.join(lines)
+
+
+def testcase_hash(testcase):
+    """测试用例按其中各teststep的规范形式计算的hash"""
+    digest = hashlib.sha1()
+    for step in testcase.blocks('teststep'):
+        digest.update(hashlib.sha1(canonical_block(step).encode('utf-8')).digest())
+    return digest.hexdigest()
+
+
+def redundant_cases(testcases, case_coverage):
+    """
+    按上一次执行中每个用例覆盖的条目, 找出覆盖的条目全部能被其他保留用例覆盖的用例
+    没有覆盖信息或上次没有通过的用例一律保留; 覆盖条目少的用例先考虑删除
+    """
+    counts = {}
+    for items in case_coverage.values():
+        for item in items:
+            counts[item] = counts.get(item, 0) + 1
+    redundant = set()
+    candidates = [case for case in testcases if case_coverage.get(case.name)]
+    for case in sorted(candidates, key=lambda case: len(case_coverage[case.name])):
+        items = case_coverage[case.name]
+        if all(counts[item] > 1 for item in items):
+            redundant.add(case.name)
+            for item in items:
+                counts[item] -= 1
+    return redundant
+
+
+def dedupe_script(text, case_coverage=None):
+    """
+    删除重复和多余的测试用例, 返回 (新脚本, 删除记录列表)
+    - teststep规范化后完全相同的测试用例只保留第一个
+    - 给出case_coverage({用例编号: 覆盖条目集合}, 来自上一次执行的报告)时,
+      再删除覆盖的条目已经全部被其他用例覆盖的用例
+    删除记录: {'testcase': 编号, 'index': 序号, 'reason': 'duplicate'(same_as为保留的用例序号) 或 'covered'}
+    保留的用例不重新编号, 与上一次报告中的用例编号保持对应
+    """
+    tree = parse_script(text, strict=False)
+    testobject = tree.find('testobject')
+    if testobject is None:
+        return text, []
+    removed = []
+    seen = {}
+    # index是用例在脚本中的序号(从1开始), 脚本中的用例编号可能重复
+    for index, case in enumerate(testobject.blocks('testcase'), 1):
+        key = testcase_hash(case)
+        if key in seen:
+            testobject.remove(case)
+            removed.append({'testcase': case.name, 'index': index, 'reason': 'duplicate', 'same_as': seen[key]})
+        else:
+            seen[key] = index
+    if case_coverage:
+        remaining = testobject.blocks('testcase')
+        names = [case.name for case in remaining]
+        # 编号重复的用例无法与报告对应, 不参与删除
+        coverage = {name: set(items) for name, items in case_coverage.items() if names.count(name) == 1}
+        redundant = redundant_cases(remaining, coverage)
+        for case in remaining:
+            # 至少保留一个测试用例
+            if case.name in redundant and len(testobject.blocks('testcase')) > 1:
+                testobject.remove(case)
+                removed.append({'testcase': case.name, 'index': seen[testcase_hash(case)], 'reason': 'covered'})
+    if not removed:
+        return text, []
+    return tree.to_text(), removed
+
+
+if __name__ == '__main__':
+    # 对比原来的多次替换 + 逐字符括号计数与单次扫描的耗时
+    # python tessy_script.py --size-mb 8
+    import argparse
+    import time
+
+    def legacy_sanitize(text):
+        text = re.sub(r'testcase\d+:', '', text)
+        text = re.sub(r'\$uuid\s+"[^"]*"', r'$uuid ""', text)
+        text = re.sub(r'\$uuid\s+[^\s\n]+', r'$uuid ""', text)
+        text = text.replace('```plaintext', '').replace('```c', '').replace('```', '')
+        balance = 0
+        for char in text:
+            if char == '{':
+                balance += 1
+            elif char == '}':
+                balance -= 1
+        if balance > 0:
+            text += '\n}\n' * balance
+        return text
+
+    parser = argparse.ArgumentParser(description='script sanitizer benchmark')
+    parser.add_argument('--size-mb', type=float, default=8, help='生成的测试脚本大小(MB)')
+    parser.add_argument('--script', default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                         'data', 'CpuTest_AluArith.script'))
+    args = parser.parse_args()
+
+    with open(args.script, 'r', encoding='utf-8') as file:
+        script = file.read()
+    # 用示例脚本的测试用例加上UUID、testcase标签和带括号的桩函数体拼出大脚本
+    stub = ("\t\t\t$stubfunctions {\n\t\t\t\tunsigned char stub1(int * a) '''\n"
+            "\t\t\t\t\tswitch (step) {\n\t\t\t\t\tcase 0:\n\t\t\t\t\t\treturn 1;\n\t\t\t\t\t}\n"
+            "\t\t\t\t'''\n\t\t\t}\n\t\t\t$inputs {")
+    cases = script[script.index('{') + 1:script.rindex('}')]
+    cases = cases.replace('$uuid ""', '$uuid "04972c0f-70aa-47cf-a62d-3ab94ce495a2"')
+    cases = cases.replace(' $testcase', ' testcase1: $testcase').replace('\t\t\t$inputs {', stub)
+    repeat = max(1, int(args.size_mb * 1024 * 1024 / len(cases)))
+    text = '```plaintext\n$testobject{\n' + cases * repeat + '}\n```'
+    print(f'script: {len(text) / 1024 / 1024:.1f} MB, {text.count("$testcase")} test cases')
+
+    for name, sanitize in (('legacy', legacy_sanitize), ('single-pass', lambda t: sanitize_script(t)[0])):
+        start = time.perf_counter()
+        result = sanitize(text)
+        elapsed = time.perf_counter() - start
+        print(f'{name:>11}: {elapsed:.3f}s, {len(text) / 1024 / 1024 / elapsed:.1f} MB/s, '
+              f'{result.count("{") - result.count("}"):+d} unbalanced braces')
+    print('errors:', sanitize_script(text)[1][:5])
+
+    start = time.perf_counter()
+    tree = parse_script(text, strict=False)
+    parsed = time.perf_counter()
+    assert tree.to_text() == text
+    print(f'parse: {parsed - start:.3f}s, to_text: {time.perf_counter() - parsed:.3f}s (round trip identical)')
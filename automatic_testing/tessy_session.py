@@ -0,0 +1,61 @@
+import os
+import re
+import threading
+import time
+
+from tessy_script import ScriptBuilder
+
+DEFAULT_TOKEN = 'default'
+TOKEN_PATTERN = re.compile(r'^[A-Za-z0-9_-]{1,64}$')
+
+
+class Workspace:
+    """单个客户端的工作区: 当前测试对象, 待保存的用例片段和独立的数据目录"""
+
+    def __init__(self, token, data_dir):
+        self.token = token
+        self.data_dir = data_dir
+        self.test_case = None
+        self.case_content = ScriptBuilder()
+        self.last_run_at = None
+        self.lock = threading.RLock()
+        self.last_used = time.time()
+
+    def script_path(self):
+        return os.path.join(self.data_dir, f'{self.test_case}.script')
+
+
+class SessionManager:
+    """
+    按客户端token隔离工作区, Tessy后端只有一个, 通过backend_lock串行访问
+    不带token的请求使用default工作区, 数据目录仍是base_dir, 兼容旧客户端
+    """
+
+    def __init__(self, base_dir='data', idle_timeout=24 * 3600):
+        self.base_dir = base_dir
+        self.idle_timeout = idle_timeout
+        self.backend_lock = threading.RLock()
+        self._workspaces = {}
+        self._lock = threading.Lock()
+
+    def get(self, token=None):
+        """获取(必要时创建)token对应的工作区, token不合法时抛出ValueError"""
+        token = token or DEFAULT_TOKEN
+        if not TOKEN_PATTERN.match(token):
+            raise ValueError(f"Invalid client token '{token}'")
+        now = time.time()
+        with self._lock:
+            self._expire(now)
+            workspace = self._workspaces.get(token)
+            if workspace is None:
+                data_dir = self.base_dir if token == DEFAULT_TOKEN else os.path.join(self.base_dir, token)
+                os.makedirs(data_dir, exist_ok=True)
+                workspace = self._workspaces[token] = Workspace(token, data_dir)
+            workspace.last_used = now
+            return workspace
+
+    def _expire(self, now):
+        """丢弃长时间未使用的工作区(只释放内存, 不删除文件)"""
+        for token, workspace in list(self._workspaces.items()):
+            if token != DEFAULT_TOKEN and now - workspace.last_used > self.idle_timeout:
+                del self._workspaces[token]
@@ -0,0 +1,288 @@
+import os
+import queue
+import threading
+import time
+import uuid
+import xml.etree.ElementTree as ET
+
+from tessy_utils import TessyManager
+
+DEFAULT_TBS_TEMPLATE = 'uploads/batch_test.tbs'
+
+
+def prepare_shard_tbs(template, tbs_file, report_dir):
+    """从模板生成分片的TBS文件: 清空模板中的测试对象, 报告输出到分片自己的目录"""
+    tree = ET.parse(template)
+    root = tree.getroot()
+    testcollection = root.find('elements/testcollection')
+    if testcollection is None:
+        raise ValueError("Test collection 'UnitTest' not found")
+    for module in testcollection.findall('module'):
+        testcollection.remove(module)
+    for option in root.iter('option'):
+        if option.get('key') == 'reportOutputDirectory':
+            option.set('value', os.path.abspath(report_dir))
+    tree.write(tbs_file, xml_declaration=True, encoding='utf-8', method="xml")
+
+
+def split_shards(test_objects, workers, shard_size=None):
+    """
+    把测试对象分成若干分片: 默认每个worker一个分片; 指定shard_size时按大小切分(分片数不少于worker数)
+    分片比worker多时, 先执行完的worker会继续领取剩下的分片
+    """
+    test_objects = list(test_objects)
+    count = workers
+    if shard_size:
+        count = max(count, -(-len(test_objects) // shard_size))
+    count = max(1, min(count, len(test_objects)))
+    return [test_objects[i::count] for i in range(count)]
+
+
+class TessyWorker:
+    """一个Tessy后端(一台主机或一个实例): 有自己的tessycmd调用层和测试对象索引"""
+
+    def __init__(self, name, cmd, object_index_path=None):
+        self.name = name
+        self.cmd = cmd
+        self.object_index_path = object_index_path or f'data/test_object_index_{name}.json'
+
+
+class ShardedRunner:
+    """
+    把一批测试对象分片后在多个Tessy后端上并行执行, 合并各测试对象的覆盖率和用例结果
+    每个分片有自己的TBS文件(模板 + save_tbs_file)和报告目录: work_dir/<run_id>/shard_<n>/
+    同一个worker上的分片按顺序执行; 分片执行失败时换一个worker重试(最多retries次)
+    """
+
+    def __init__(self, workers, tbs_template=DEFAULT_TBS_TEMPLATE, work_dir='data/shards', shard_size=None,
+                 report_timeout=600, retries=1, coverage_db_path='data/coverage_history.db'):
+        if not workers:
+            raise ValueError('At least one worker is required')
+        self.workers = list(workers)
+        self.tbs_template = tbs_template
+        self.work_dir = work_dir
+        self.shard_size = shard_size
+        self.report_timeout = report_timeout
+        self.retries = retries
+        self.coverage_db_path = coverage_db_path
+
+    def _shard_manager(self, worker, shard_dir):
+        report_dir = os.path.join(shard_dir, 'report')
+        os.makedirs(report_dir, exist_ok=True)
+        tbs_file = os.path.join(shard_dir, 'batch_test.tbs')
+        prepare_shard_tbs(self.tbs_template, tbs_file, report_dir)
+        return TessyManager(tbs_file=tbs_file, report_path=report_dir, cmd=worker.cmd,
+                            object_index_path=worker.object_index_path, coverage_db_path=self.coverage_db_path)
+
+    def resolve(self, test_objects):
+        """在第一个worker上查找各测试对象所在的模块(走它的测试对象索引), 返回 {测试对象: 模块}"""
+        worker = self.workers[0]
+        manager = TessyManager(tbs_file=self.tbs_template, report_path=self.work_dir, cmd=worker.cmd,
+                               object_index_path=worker.object_index_path, coverage_db_path=self.coverage_db_path)
+        try:
+            if not manager.tessy_project_init():
+                raise RuntimeError('Failed to initialize Tessy project')
+            modules = {}
+            for name in test_objects:
+                location = manager.object_index.find(name)
+                if location is not None:
+                    modules[name] = location[1]
+            return modules
+        finally:
+            manager.close()
+
+    def _run_shard(self, worker, shard_dir, test_objects, modules, scripts):
+        """在一个worker上执行一个分片, 返回 {测试对象: 结果}; 整个分片失败时抛出RuntimeError"""
+        manager = self._shard_manager(worker, shard_dir)
+        try:
+            return self._execute_shard(manager, test_objects, modules, scripts)
+        finally:
+            manager.close()
+
+    def _execute_shard(self, manager, test_objects, modules, scripts):
+        if not manager.tessy_project_init():
+            raise RuntimeError('Failed to initialize Tessy project')
+
+        results = {}
+        selected = []
+        for name in test_objects:
+            module = modules.get(name)
+            if module is None:
+                results[name] = {'error': f"Test object '{name}' not found"}
+                continue
+            if name in scripts:
+                if manager.object_index.select(name) is None or not manager.import_test_script(scripts[name]):
+                    results[name] = {'error': 'Failed to import test case'}
+                    continue
+            manager.save_tbs_file(module, name, keep_existing=True)
+            selected.append(name)
+        if not selected:
+            return results
+
+        started = time.time()
+        if not manager.exec_test():
+            raise RuntimeError('Failed to execute test objects')
+        for name in selected:
+            report = manager.wait_for_report(name, since=started, timeout=self.report_timeout)
+            if report is None:
+                results[name] = {'error': f"No matching XML report found for test case '{name}'"}
+                continue
+            details = manager.get_report_details(report)
+            verdicts = [testcase['result'] for testcase in details['testcases']]
+            results[name] = {
+                'report': report,
+                'coverage': details['coverage'],
+                'coverage_ok': manager.check_report_coverage(report),
+                'passed': verdicts.count('passed'),
+                'failed': len(verdicts) - verdicts.count('passed'),
+                'testcases': details['testcases'],
+            }
+        return results
+
+    def run(self, test_objects, scripts=None):
+        """
+        执行测试对象并合并结果; scripts为 {测试对象: 脚本路径} 时先导入脚本再执行
+        返回 {'run_id', 'elapsed', 'shards': [...], 'test_objects': {名称: 结果}, 'summary': {...}}
+        """
+        scripts = scripts or {}
+        start = time.perf_counter()
+        modules = self.resolve(test_objects)
+        # 同一秒内开始的多次执行不能共用分片目录
+        run_id = f"{time.strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+        run_dir = os.path.join(self.work_dir, run_id)
+        os.makedirs(run_dir)
+        shards = split_shards(test_objects, len(self.workers), self.shard_size)
+        pending = queue.Queue()
+        for index, shard in enumerate(shards):
+            pending.put((index, shard, 0, None))
+        shard_results = [None] * len(shards)
+        merged = {}
+        lock = threading.Lock()
+        remaining = [len(shards)]
+
+        def work(worker):
+            while True:
+                with lock:
+                    if not remaining[0]:
+                        return
+                try:
+                    index, shard, attempt, failed_on = pending.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                if failed_on == worker.name and len(self.workers) > 1:
+                    # 重试的分片优先交给其他worker
+                    pending.put((index, shard, attempt, failed_on))
+                    time.sleep(0.05)
+                    continue
+                shard_dir = os.path.join(run_dir, f'shard_{index}_{attempt}')
+                shard_start = time.perf_counter()
+                try:
+                    results = self._run_shard(worker, shard_dir, shard, modules, scripts)
+                    error = None
+                except Exception as e:
+                    results = None
+                    error = str(e)
+                if error is not None and attempt < self.retries:
+                    pending.put((index, shard, attempt + 1, worker.name))
+                    continue
+                if results is None:
+                    results = {name: {'error': error} for name in shard}
+                for result in results.values():
+                    result.update(worker=worker.name, shard=index)
+                with lock:
+                    shard_results[index] = {
+                        'shard': index,
+                        'worker': worker.name,
+                        'test_objects': shard,
+                        'attempts': attempt + 1,
+                        'elapsed': time.perf_counter() - shard_start,
+                        'error': error,
+                    }
+                    merged.update(results)
+                    remaining[0] -= 1
+
+        threads = [threading.Thread(target=work, args=(worker,), name=f'tessy-shard-{worker.name}', daemon=True)
+                   for worker in self.workers]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        ordered = {name: merged[name] for name in test_objects if name in merged}
+        return {
+            'run_id': run_id,
+            'elapsed': time.perf_counter() - start,
+            'shards': shard_results,
+            'test_objects': ordered,
+            'summary': self.summarize(ordered),
+        }
+
+    @staticmethod
+    def summarize(results):
+        """合并后的统计: 成功/失败的测试对象数, 用例结果数, 各类型覆盖率的平均值"""
+        executed = [result for result in results.values() if 'error' not in result]
+        coverage = {}
+        for result in executed:
+            for name, value in result['coverage'].items():
+                coverage.setdefault(name, []).append(value)
+        return {
+            'total': len(results),
+            'executed': len(executed),
+            'errors': len(results) - len(executed),
+            'coverage_ok': sum(1 for result in executed if result['coverage_ok']),
+            'testcases_passed': sum(result['passed'] for result in executed),
+            'testcases_failed': sum(result['failed'] for result in executed),
+            'coverage': {name: sum(values) / len(values) for name, values in coverage.items()},
+        }
+
+
+if __name__ == '__main__':
+    # 用fake_tessycmd.py模拟多个Tessy实例, 对比单个worker串行执行和多个worker分片并行执行
+    # python tessy_shards.py --workers 4 --modules 8 --objects 5 --exec-time 0.2
+    import argparse
+    import contextlib
+    import io
+    import json
+    import shutil
+    import sys
+    import tempfile
+    from tessy_cmd import TessyCommandRunner
+
+    parser = argparse.ArgumentParser(description='sharded Tessy execution with fake tessycmd')
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--modules', type=int, default=8, help='模拟项目中的模块数')
+    parser.add_argument('--objects', type=int, default=5, help='每个模块的测试对象数')
+    parser.add_argument('--latency', type=float, default=0.05, help='fake tessycmd每次调用的模拟耗时(秒)')
+    parser.add_argument('--exec-time', type=float, default=0.2, help='每个测试对象的模拟执行耗时(秒)')
+    parser.add_argument('--shard-size', type=int, default=None)
+    args = parser.parse_args()
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    work_dir = tempfile.mkdtemp()
+    modules = {f'Module{m}': [f'Module{m}_Func{o}' for o in range(args.objects)] for m in range(args.modules)}
+    config_path = os.path.join(work_dir, 'config.json')
+    with open(config_path, 'w', encoding='utf-8') as file:
+        json.dump({'P08593_SCU': {'UnitTest': modules}}, file)
+    names = [name for objects in modules.values() for name in objects]
+    fake_command = [sys.executable, os.path.join(here, 'fake_tessycmd.py')]
+
+    def make_workers(count, mode):
+        return [TessyWorker(f'{mode}{i}', TessyCommandRunner(fake_command, env={
+            'FAKE_TESSY_STATE': os.path.join(work_dir, f'{mode}{i}_state.json'),
+            'FAKE_TESSY_CONFIG': config_path,
+            'FAKE_TESSY_LATENCY': str(args.latency),
+            'FAKE_TESSY_EXEC_TIME': str(args.exec_time),
+        }), os.path.join(work_dir, f'{mode}{i}_index.json')) for i in range(count)]
+
+    try:
+        for mode, count in (('serial', 1), ('sharded', args.workers)):
+            runner = ShardedRunner(make_workers(count, mode), tbs_template=os.path.join(here, 'uploads', 'batch_test.tbs'),
+                                   work_dir=os.path.join(work_dir, mode), shard_size=args.shard_size,
+                                   report_timeout=30, coverage_db_path=os.path.join(work_dir, f'{mode}.db'))
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = runner.run(names)
+            summary = result['summary']
+            print(f"{mode:>8}: {count} workers, {len(result['shards'])} shards, {result['elapsed']:.2f}s, "
+                  f"{summary['executed']}/{summary['total']} executed, coverage {summary['coverage']}")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
@@ -1,20 +1,51 @@
-import re
 import subprocess
 from xml.dom import minidom
 import xml.etree.ElementTree as ET
 import os
-import glob
+import time
 from datetime import datetime
+from tessy_cmd import TessyCommandRunner
+from tessy_index import TestObjectIndex
+from tessy_reports import ReportIndex, extract_coverage, tbs_coverage_types
+from tessy_coverage import CoverageStore
+from tessy_script import dedupe_script, parse_script, sanitize_script
+
+
+def wait_until(condition, timeout=60, initial_interval=0.2, max_interval=5.0, backoff=2.0, abort=None):
+    """
+    轮询condition直到返回真值或超时, 轮询间隔从initial_interval指数增长到max_interval
+    abort返回真值时提前放弃; 成功返回condition的结果, 超时或放弃返回None
+    """
+    deadline = time.monotonic() + timeout
+    interval = initial_interval
+    while True:
+        result = condition()
+        if result:
+            return result
+        if abort is not None and abort():
+            return None
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return None
+        time.sleep(min(interval, remaining))
+        interval = min(interval * backoff, max_interval)
 
 class TessyManager:
-    def __init__(self, tbs_file="uploads/batch_test.tbs", report_path="D:\\svn_code\\GWM\\D01\\P08593_SCU\\Appl\\branches\\B16_B26_NoPp\\Appl_C\\Tools\\Tessy\\report"):
+    def __init__(self, tbs_file="uploads/batch_test.tbs", report_path="D:\\svn_code\\GWM\\D01\\P08593_SCU\\Appl\\branches\\B16_B26_NoPp\\Appl_C\\Tools\\Tessy\\report", cmd=None, object_index_path="data/test_object_index.json", coverage_db_path="data/coverage_history.db"):
         self.tbs_file = tbs_file
         self.report_path = report_path
+        self.cmd = cmd or TessyCommandRunner()
+        self.object_index = TestObjectIndex(self.cmd, object_index_path)
+        self.report_index = ReportIndex(report_path)
+        self.coverage_store = CoverageStore(coverage_db_path)
     
-    def connect_tessy(self):
-        """连接到Tessy"""
+    def connect_tessy(self, reconnect=False):
+        """连接到Tessy, reconnect为True时即使已连接也重新connect一次(检查Tessy是否可用)"""
         try:
-            subprocess.run(['tessycmd', 'connect'], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            if reconnect:
+                self.cmd.reconnect()
+            else:
+                self.cmd.connect()
             print('Connected to Tessy')
             return True
         except subprocess.CalledProcessError as e:
@@ -25,8 +56,7 @@ class TessyManager:
     def get_tessy_project_list(self):
         """获取Tessy项目列表"""
         try:
-            result = subprocess.run(['tessycmd', 'list-projects'], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            output = result.stdout.decode('utf-8')
+            output = self.cmd.run(['list-projects'])
             if output == '':
                 print('No projects found')
                 return []
@@ -40,7 +70,7 @@ class TessyManager:
     def select_tessy_project(self, project_name):
         """选择Tessy项目"""
         try:
-            subprocess.run(['tessycmd', 'select-project', project_name], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            self.cmd.run(['select-project', project_name])
             print('Selected project: ', project_name)
             return True
         except subprocess.CalledProcessError as e:
@@ -51,8 +81,7 @@ class TessyManager:
     def get_tessy_test_collections(self):
         """获取测试集合"""
         try:
-            result = subprocess.run(['tessycmd', 'list-test-collections'], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            output = result.stdout.decode('utf-8')
+            output = self.cmd.run(['list-test-collections'])
             if output == '':
                 print('No test collections found')
                 return []
@@ -66,7 +95,7 @@ class TessyManager:
     def select_test_collection(self, collection_name):
         """选择测试集合"""
         try:
-            subprocess.run(['tessycmd', 'select-test-collection', collection_name], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            self.cmd.run(['select-test-collection', collection_name])
             print('Selected test collection: ', collection_name)
             return True
         except subprocess.CalledProcessError as e:
@@ -77,8 +106,7 @@ class TessyManager:
     def get_tessy_test_modules(self):
         """获取测试模块"""
         try:
-            result = subprocess.run(['tessycmd', 'list-modules', '-test-collection'], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-            output = result.stdout.decode('utf-8')
+            output = self.cmd.run(['list-modules', '-test-collection'])
             if output == '':
                 print('No test modules found')
                 return []
@@ -91,28 +119,21 @@ class TessyManager:
 
     def update_tessy_test_object(self, test_object_name):
         """更新测试对象"""
-        test_modules = self.get_tessy_test_modules()
-        for test_module in test_modules:
-            try:
-                subprocess.run(['tessycmd', 'select-module', '-test-collection', test_module], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                result = subprocess.run(['tessycmd', 'list-test-objects'], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                if result == '':
-                    print('No test objects found')
-                else:
-                    test_objects = result.stdout.decode('utf-8').splitlines()
-                    for test_object in test_objects:
-                        if test_object == test_object_name:
-                            subprocess.run(['tessycmd', 'select-test-object', test_object], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-                            print('Selected test object in module: ', test_object, test_module)
-                            self.save_tbs_file(test_module, test_object)
-                            return True
-            except subprocess.CalledProcessError as e:
-                error_message = e.stderr.decode('utf-8')
-                print(f"An error occurred: {error_message}")
-        return False
+        try:
+            test_module = self.object_index.select(test_object_name)
+        except subprocess.CalledProcessError as e:
+            error_message = e.stderr.decode('utf-8')
+            print(f"An error occurred: {error_message}")
+            return False
+        if test_module is None:
+            print('No test objects found')
+            return False
+        print('Selected test object in module: ', test_object_name, test_module)
+        self.save_tbs_file(test_module, test_object_name)
+        return True
 
-    def save_tbs_file(self, test_module, test_object):
-        """保存TBS文件"""
+    def save_tbs_file(self, test_module, test_object, keep_existing=False):
+        """保存TBS文件, keep_existing为True时保留模块中已有的测试对象(一次执行多个测试对象)"""
         tree = ET.parse(self.tbs_file)
         root = tree.getroot()
         testcollection = root.find('elements/testcollection')
@@ -123,10 +144,12 @@ class TessyManager:
         if module_element is None:
             module_element = ET.SubElement(testcollection, 'module', {'name': test_module})
 
-        for testobj in module_element.findall('testobject'):
-            module_element.remove(testobj)
+        if not keep_existing:
+            for testobj in module_element.findall('testobject'):
+                module_element.remove(testobj)
 
-        new_testobject = ET.SubElement(module_element, 'testobject', {'name': test_object})
+        if module_element.find(f"testobject[@name='{test_object}']") is None:
+            ET.SubElement(module_element, 'testobject', {'name': test_object})
 
         tree.write(self.tbs_file, xml_declaration=True, encoding='utf-8', method="xml")
         with open(self.tbs_file, 'w', encoding='utf-8') as file:
@@ -140,12 +163,52 @@ class TessyManager:
         pretty_xml = '\n'.join([line for line in pretty_xml.splitlines() if line.strip() != ''])
         return pretty_xml
 
-    def execute_tessy_test_object(self, file):
-        """执行测试对象"""
+    def dedupe_test_script(self, file, test_object=None, prune_covered=False, script_hash=None):
+        """
+        导入前删除脚本中重复的测试用例, 返回 (要导入的脚本路径, 删除记录)
+        prune_covered时按同一脚本(script_hash相同)第一次执行的报告, 再删除覆盖已被其他用例达到的用例
+        有删除时结果写到 <名称>.dedup.script, 原脚本不变
+        """
+        content = self.read_file_content(file)
+        case_coverage = None
+        if prune_covered and test_object and script_hash:
+            # 同一脚本只用第一次拿到的覆盖信息: 之后的报告来自删减后的脚本,
+            # 被删掉的用例没有覆盖信息, 直接使用会让删除结果在两次执行之间来回变化
+            case_coverage = self.coverage_store.pruning_coverage(test_object, script_hash)
+            if case_coverage is None:
+                try:
+                    details = self.get_report_details(self.get_xml_report(test_object))
+                except (FileNotFoundError, ET.ParseError):
+                    details = None
+                if details is not None and details.get('script_hash') == script_hash:
+                    case_coverage = {testcase['id']: testcase['covered'] for testcase in details['testcases']
+                                     if testcase.get('covered') and testcase['result'] == 'passed'}
+                    if case_coverage:
+                        self.coverage_store.save_pruning_coverage(test_object, script_hash, case_coverage)
+        deduped, removed = dedupe_script(content, case_coverage)
+        if not removed:
+            return file, []
+        dedup_file = os.path.splitext(file)[0] + '.dedup.script'
+        with open(dedup_file, 'w', encoding='utf-8') as f:
+            f.write(deduped)
+        print(f'Removed {len(removed)} redundant test cases')
+        return dedup_file, removed
+
+    def import_test_script(self, file):
+        """导入测试脚本"""
         try:
-            subprocess.run(['tessycmd', 'import', '-set-passing', file], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            self.cmd.run(['import', '-set-passing', file])
             print('File imported successfully')
-            subprocess.run(['tessycmd', 'exec-test', self.tbs_file], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+            return True
+        except subprocess.CalledProcessError as e:
+            error_message = e.stderr.decode('utf-8')
+            print(f"An error occurred: {error_message}")
+            return False
+
+    def exec_test(self):
+        """按TBS文件执行测试"""
+        try:
+            self.cmd.run(['exec-test', self.tbs_file])
             print('Test object executed successfully')
             return True
         except subprocess.CalledProcessError as e:
@@ -153,22 +216,30 @@ class TessyManager:
             print(f"An error occurred: {error_message}")
             return False
 
-    def check_report_coverage(self, report_file):
+    def execute_tessy_test_object(self, file):
+        """执行测试对象"""
+        return self.import_test_script(file) and self.exec_test()
+
+    def check_report_coverage(self, report_file, script_hash=None):
         """检查报告覆盖率"""
         try:
-            tree = ET.parse(report_file)
-            root = tree.getroot()
-            c0_element = root.find('.//coverage/c0')
-            c1_element = root.find('.//coverage/c1')
-
-            c0_percentage = float(c0_element.get('percentage'))
-            c1_percentage = float(c1_element.get('percentage'))
+            coverage = self.get_report_details(report_file, script_hash)['coverage']
+            c0_percentage = coverage['STATEMENT']
+            c1_percentage = coverage['BRANCH']
             
             return c0_percentage >= 85 and c1_percentage >= 85
         except Exception as e:
             print(f"Error checking coverage: {e}")
             return False
 
+    def get_report_details(self, report_file, script_hash=None):
+        """报告中tbs文件配置的所有覆盖率类型和每个测试用例的结果, 解析过的报告直接从覆盖率存储中读取"""
+        details = self.coverage_store.lookup(report_file, script_hash)
+        if details is None:
+            details = extract_coverage(report_file, tbs_coverage_types(self.tbs_file))
+            details = self.coverage_store.record(report_file, details, script_hash)
+        return details
+
     def tessy_project_init(self):
         """初始化Tessy项目"""
         if not self.connect_tessy():
@@ -193,72 +264,65 @@ class TessyManager:
 
     def get_xml_report(self, case_name):
         """获取XML报告"""
-        search_path = os.path.join(self.report_path, '*.xml')
-        files = glob.glob(search_path)
-        
-        filtered_files = [f for f in files if case_name in os.path.basename(f) and not f.endswith('.notes.xml')]
-        
-        if not filtered_files:
+        latest_file = self.report_index.latest('xml', case_name)
+        if latest_file is None:
             raise FileNotFoundError(f"No matching XML report found for test case '{case_name}'")
-        
-        latest_file = max(filtered_files, key=os.path.getmtime)
         return latest_file
 
+    def wait_for_report(self, case_name, since=0, timeout=600):
+        """
+        等待生成修改时间不早于since的XML报告, 超时返回None
+        报告中的测试对象名与case_name不同时跳过(如 Func_1 和 Func_1_2 的报告文件名无法区分)
+        """
+        def new_report():
+            for mtime, report in self.report_index.reports('xml', case_name):
+                if mtime < since:
+                    break
+                try:
+                    test_object = self.get_report_details(report)['test_object']
+                except (FileNotFoundError, ET.ParseError):
+                    # 报告还没写完, 下次轮询再读
+                    continue
+                if test_object in (None, case_name):
+                    return report
+            return None
+        return wait_until(new_report, timeout=timeout, max_interval=2.0)
+
     def get_txt_report(self, case_name):
         """获取TXT报告"""
-        search_path_c0 = os.path.join(self.report_path, '*.c0.txt')
-        search_path_c1 = os.path.join(self.report_path, '*.c1.txt')
+        latest_file_c0 = self.report_index.latest('c0', case_name)
+        latest_file_c1 = self.report_index.latest('c1', case_name)
         
-        files_c0 = glob.glob(search_path_c0)
-        files_c1 = glob.glob(search_path_c1)
-        
-        filtered_files_c0 = [f for f in files_c0 if case_name in os.path.basename(f)]
-        filtered_files_c1 = [f for f in files_c1 if case_name in os.path.basename(f)]
-        
-        if not filtered_files_c0 or not filtered_files_c1:
+        if latest_file_c0 is None or latest_file_c1 is None:
             raise FileNotFoundError(f"No matching txt reports found for test case '{case_name}'")
         
-        latest_file_c0 = max(filtered_files_c0, key=os.path.getmtime)
-        latest_file_c1 = max(filtered_files_c1, key=os.path.getmtime)
-        
+        self.coverage_store.attach_txt_reports(case_name, latest_file_c0, latest_file_c1)
         return latest_file_c0, latest_file_c1
 
+    def close(self):
+        """停止报告目录的后台扫描, 关闭覆盖率数据库"""
+        self.report_index.stop_watcher()
+        self.coverage_store.close()
+
     @staticmethod
     def extract_testobject(text):
-        """提取测试对象"""
-        pattern = r'\$testobject\s*\{(.*?)\}'
-        match = re.search(pattern, text, re.DOTALL)
+        """提取测试对象: $testobject块内的全部内容(括号按层级配对)"""
+        testobject = parse_script(text, strict=False).find('testobject')
         
-        if match:
-            return match.group(1).strip()
+        if testobject is not None:
+            return testobject.inner_text().strip()
         else:
             return ""
 
     @staticmethod
     def modify_text_style(script_content):
-        """修改文本样式"""
-        script_content = script_content.replace('```plaintext', '').replace('```c', '').replace('```', '')
-        balance = 0
-        for char in script_content:
-            if char == '{':
-                balance += 1
-            elif char == '}':
-                balance -= 1
-        if balance > 0:
-            script_content += '\n}\n' * balance
-        return script_content
+        """修改文本样式: 去掉代码块标记, 补齐未闭合的括号"""
+        return sanitize_script(script_content, strip_labels=False, clear_uuids=False)[0]
 
     @staticmethod
     def clear_all_uuids(content):
         """清除所有UUID"""
-        uuid_patterns = [
-            (r'\$uuid\s+"[^"]*"', r'$uuid ""'),
-            (r'\$uuid\s+[^\s\n]+', r'$uuid ""'),
-        ]
-        processed_content = content
-        for pattern, replacement in uuid_patterns:
-            processed_content = re.sub(pattern, replacement, processed_content)
-        return processed_content
+        return sanitize_script(content, strip_fences=False, strip_labels=False, balance_braces=False)[0]
 
     @staticmethod
     def read_file_content(file_path):
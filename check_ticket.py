@@ -1,74 +1,92 @@
-import json
-
 import requests
 
+from station_index import get_station_index
+from ticket_parser import format_seat, parse_result
+
+QUERY_URL = "https://kyfw.12306.cn/otn/leftTicket/queryG"
+QUERY_HEADERS = {
+    "Cookie": "JSESSIONID=0"
+}
+
+
+class TicketQueryError(Exception):
+    """余票接口返回了无法使用的结果"""
+
+
+class TicketThrottled(TicketQueryError):
+    """被 12306 限流: 跳转到 error.html 或返回了 HTML 页面"""
+
+
+def build_query_params(train_date, from_station, to_station):
+    return {
+        "leftTicketDTO.train_date": train_date,
+        "leftTicketDTO.from_station": from_station,
+        "leftTicketDTO.to_station": to_station,
+        "purpose_codes": "ADULT"
+    }
 
-def fetch_ticket_data(train_date, from_station, to_station):
+
+def query_left_ticket(train_date, from_station, to_station, session=None, query_url=QUERY_URL, timeout=10):
+    """查询余票, 返回 data["result"] 原始行列表; 网络异常原样抛出, 其余错误抛出 TicketQueryError"""
+    http = session if session is not None else requests
+    response = http.get(query_url, params=build_query_params(train_date, from_station, to_station),
+                        headers=QUERY_HEADERS, timeout=timeout)
+    # 检查是否返回了错误页面
+    if "error.html" in response.url:
+        raise TicketThrottled("返回了错误页面，可能是请求被拦截或参数错误。")
+    if response.status_code != 200 or not response.text.strip():
+        raise TicketQueryError("返回内容为空或状态码异常。")
     try:
-        query_url = "https://kyfw.12306.cn/otn/leftTicket/queryG"
-        params = {
-            "leftTicketDTO.train_date": train_date,
-            "leftTicketDTO.from_station": from_station,
-            "leftTicketDTO.to_station": to_station,
-            "purpose_codes": "ADULT"
-        }
-
-        headers = {
-            "Cookie": "JSESSIONID=0"
-        }
-        response = requests.get(query_url, params=params, headers=headers, timeout=10)
-        # 检查是否返回了错误页面
-        if "error.html" in response.url:
-            print("返回了错误页面，可能是请求被拦截或参数错误。")
-            return False
-
-        if response.status_code == 200 and response.text.strip():
-            data = response.json()
-            if data["status"] and data["data"]["result"]:
-                train_list = data["data"]["result"]
-                for train in train_list:
-                    train_info = train.split("|")
-                    train_no = train_info[3]
-                    start_time = train_info[8]
-                    end_time = train_info[9]
-                    duration = train_info[10]
-                    seat_info = {
-                        "商务座": train_info[32] or train_info[25],
-                        "一等座": train_info[31],
-                        "二等座": train_info[30],
-                        "软卧": train_info[23],
-                        "硬卧": train_info[28],
-                        "硬座": train_info[29],
-                        "无座": train_info[26]
-                    }
-                    print(f"车次：{train_no}")
-                    print(f"出发时间：{start_time}，到达时间：{end_time}，历时：{duration}")
-                    print("余票情况：")
-                    for seat_type, ticket_num in seat_info.items():
-                        print(f"  {seat_type}: {ticket_num}")
-                    print("-" * 40)
-                return True
-            else:
-                print("未找到符合条件的车次。")
-        else:
-            print("返回内容为空或状态码异常。")
-            return False
+        data = response.json()
+    except ValueError:
+        raise TicketThrottled("返回内容不是 JSON 格式，可能是 HTML 页面。")
+    if data.get("status") and data.get("data") and data["data"].get("result"):
+        return data["data"]["result"]
+    return []
+
+
+def fetch_ticket_data(train_date, from_station, to_station, store=None):
+    """查询并打印余票, 指定 store(TicketStore) 时解析结果同时写入时序存储"""
+    try:
+        train_list = query_left_ticket(train_date, from_station, to_station)
     except requests.exceptions.RequestException as e:
         print("请求异常：", e)
         return False
-    except json.JSONDecodeError:
-        print("返回内容不是 JSON 格式，可能是 HTML 页面。")
+    except TicketQueryError as e:
+        print(e)
         return False
 
+    if not train_list:
+        print("未找到符合条件的车次。")
+        return None
+    table = parse_result(train_list)
+    if store is not None:
+        from ticket_scan import TicketQuery
+        store.append(TicketQuery(train_date, from_station, to_station), table)
+    for train in table:
+        print(f"车次：{train['train_no']}")
+        print(f"出发时间：{train['start_time']}，到达时间：{train['end_time']}，历时：{train['duration']}")
+        print("余票情况：")
+        for seat_type, ticket_num in train["seats"].items():
+            print(f"  {seat_type}: {format_seat(ticket_num)}")
+        print("-" * 40)
+    return True
+
 
-# 读取 station.json 文件
+# 读取 station.json 文件, 索引只加载一次
 def read_stations():
-    file_path = "station.json"
-    with open(file_path, "r", encoding="utf-8") as file:
-        all_stations = json.load(file)
-    return all_stations
+    return get_station_index().by_name
 
 if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="12306 余票查询")
+    parser.add_argument("from_city", nargs="?", help="出发城市, 与到达城市一起给出时按城市查询所有站对")
+    parser.add_argument("to_city", nargs="?", help="到达城市")
+    parser.add_argument("--date", default="2025-01-23", help="乘车日期 YYYY-MM-DD")
+    parser.add_argument("--store", default="ticket_history.db", help="余票快照写入的 sqlite 文件, 传空字符串则不保存")
+    args = parser.parse_args()
+    from ticket_store import TicketStore
+    store = TicketStore(args.store) if args.store else None
     # query_url = "https://kyfw.12306.cn/otn/leftTicket/queryG"
     # params = {
     #     "leftTicketDTO.train_date": "2025-01-23",
@@ -83,9 +101,32 @@ if __name__ == '__main__':
     # response = requests.get(query_url, params=params, headers=headers, timeout=10)
     # print(response.status_code)
     # print(response.text)
-    stations = read_stations()
-    # print(stations)
-    # fetch_ticket_data("2025-01-23", stations['北京'], 'HBB')
-    for key,value in stations.items():
-        # print(value)
-        fetch_ticket_data("2025-01-23", value, 'HBB')
\ No newline at end of file
+    try:
+        if args.from_city and args.to_city:
+            from ticket_matrix import query_city_matrix
+            matrix = query_city_matrix(args.from_city, args.to_city, args.date, store=store)
+            print(f"{'/'.join(matrix.from_stations)} -> {'/'.join(matrix.to_stations)}")
+            for train in matrix.table:
+                seats = "  ".join(f"{seat_type}:{format_seat(count)}" for seat_type, count in train["seats"].items())
+                print(f"{train['train_no']}  {train['start_time']}-{train['end_time']}  {seats}")
+            for result in matrix.failed:
+                print(f"{result.query.from_station} -> {result.query.to_station}: {result.error}")
+        else:
+            stations = read_stations()
+            # print(stations)
+            # fetch_ticket_data("2025-01-23", stations['北京'], 'HBB')
+            # for key,value in stations.items():
+            #     fetch_ticket_data("2025-01-23", value, 'HBB')
+            from rate_limiter import AdaptiveRateLimiter
+            from ticket_scan import TicketQuery, TicketScanner
+            queries = [TicketQuery(args.date, value, 'HBB') for value in stations.values()]
+            # 全部车站的查询会并发打到线上接口, 用自适应限速器控制速率, 被限流时整体退避
+            with TicketScanner(rate_limiter=AdaptiveRateLimiter(), store=store) as scanner:
+                for result in scanner.scan_iter(queries):
+                    if result.ok:
+                        print(f"{result.query.from_station} -> {result.query.to_station}: {len(result.trains)} 趟车次")
+                    else:
+                        print(f"{result.query.from_station} -> {result.query.to_station}: {result.error}")
+    finally:
+        if store is not None:
+            store.close()
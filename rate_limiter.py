@@ -0,0 +1,100 @@
+import threading
+import time
+from collections import deque
+from typing import Callable, Optional
+
+
+class AdaptiveRateLimiter:
+    """
+    令牌桶限速, 速率随上游反馈自适应调整:
+    成功时按 increase_step 线性提速直到 max_rate, 被限流时速率乘以 decrease_factor,
+    并让所有调用方暂停 backoff 秒, 连续限流时 backoff 指数增长, 恢复成功后重置
+    同一次暂停之前发出的并发请求被限流只算一次, 不会把 backoff 连续翻倍
+    """
+
+    def __init__(self, rate: float = 5.0, burst: int = 5, min_rate: float = 0.5, max_rate: float = 20.0,
+                 increase_step: float = 0.1, decrease_factor: float = 0.5,
+                 base_backoff: float = 2.0, max_backoff: float = 120.0, window: float = 60.0,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        self.rate = rate
+        self.burst = burst
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.window = window
+        self.clock = clock
+        self.sleep = sleep
+        self.tokens = float(burst)
+        self.paused_until = 0.0
+        self.consecutive_throttles = 0
+        self.total_requests = 0
+        self.total_throttled = 0
+        self._updated = clock()
+        self._issued = deque()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self) -> float:
+        """取一个令牌, 没有令牌或处于退避期时阻塞, 返回发出请求的时间(传给 on_throttled)"""
+        while True:
+            with self._lock:
+                now = self.clock()
+                if now < self.paused_until:
+                    wait = self.paused_until - now
+                else:
+                    self._refill(now)
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        self.total_requests += 1
+                        self._issued.append(now)
+                        return now
+                    wait = (1 - self.tokens) / self.rate
+            self.sleep(wait)
+
+    def on_success(self):
+        with self._lock:
+            self.consecutive_throttles = 0
+            self.rate = min(self.max_rate, self.rate + self.increase_step)
+
+    def on_throttled(self, issued_at: Optional[float] = None):
+        """
+        上游限流: 降速并让整个扇出暂停一段时间
+        issued_at 为 acquire() 的返回值, 在当前暂停结束前发出的请求属于已经处理过的限流, 只计数
+        """
+        with self._lock:
+            self.total_throttled += 1
+            if issued_at is not None and issued_at < self.paused_until:
+                return
+            self.consecutive_throttles += 1
+            self.rate = max(self.min_rate, self.rate * self.decrease_factor)
+            backoff = min(self.max_backoff, self.base_backoff * 2 ** (self.consecutive_throttles - 1))
+            now = self.clock()
+            self.paused_until = max(self.paused_until, now + backoff)
+            self.tokens = 0.0
+            self._updated = self.paused_until
+
+    def achieved_rate(self) -> float:
+        """最近 window 秒内实际发出的请求速率(次/秒)"""
+        with self._lock:
+            now = self.clock()
+            while self._issued and self._issued[0] < now - self.window:
+                self._issued.popleft()
+            if not self._issued:
+                return 0.0
+            span = max(now - self._issued[0], 1.0)
+            return len(self._issued) / span
+
+    def metrics(self) -> dict:
+        return {
+            "rate": self.rate,
+            "achieved_rate": self.achieved_rate(),
+            "total_requests": self.total_requests,
+            "total_throttled": self.total_throttled,
+            "paused_for": max(0.0, self.paused_until - self.clock()),
+        }
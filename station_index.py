@@ -0,0 +1,167 @@
+import json
+import os
+import pickle
+import threading
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional
+
+try:
+    from pypinyin import Style, lazy_pinyin
+except ImportError:
+    lazy_pinyin = None
+
+STATION_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "station.json")
+CACHE_VERSION = 2
+# 没有 pypinyin 时的近似: GB2312 一级汉字按拼音排序, 按编码区间取首字母
+GB2312_INITIALS = [
+    (0xB0A1, "a"), (0xB0C5, "b"), (0xB2C1, "c"), (0xB4EE, "d"), (0xB6EA, "e"), (0xB7A2, "f"), (0xB8C1, "g"),
+    (0xB9FE, "h"), (0xBBF7, "j"), (0xBFA6, "k"), (0xC0AC, "l"), (0xC2E8, "m"), (0xC4C3, "n"), (0xC5B6, "o"),
+    (0xC5BE, "p"), (0xC6DA, "q"), (0xC8BB, "r"), (0xC8F6, "s"), (0xCBFA, "t"), (0xCDDA, "w"), (0xCEF4, "x"),
+    (0xD1B9, "y"), (0xD4D1, "z"),
+]
+GB2312_LEVEL1_END = 0xD7FA
+# station.json 中不在 GB2312 一级字库里的字, 以及站名里读音与默认排序不同的多音字
+EXTRA_INITIALS = {
+    "a": "鳌", "b": "栟亳坂璧贲砭碚鲅", "c": "岑嵯褚重朝", "d": "坻岱砀磴", "f": "垡", "g": "莞藁",
+    "h": "湟潢桦鲘", "j": "滘鄄芨苴莒菁绛缙稷蛟暨", "k": "岢", "l": "蔺岚涞溧漯濑澧榄赉耒醴", "m": "沐汨渑蟆",
+    "n": "讷", "o": "瓯", "p": "邳郫滂", "q": "蕲岐衢耆箐綦", "s": "鄯沭泗歙", "t": "郯坨沱洮潼滕", "w": "倭圩",
+    "x": "陉岘浠溆厦", "y": "攸偃兖郓蓥弋迤驿颍", "z": "诏圳涿梓豸鲊",
+}
+EXTRA_INITIAL = {char: letter for letter, chars in EXTRA_INITIALS.items() for char in chars}
+
+
+def _gb2312_initial(char: str) -> str:
+    if char.isascii():
+        return char.lower()
+    if char in EXTRA_INITIAL:
+        return EXTRA_INITIAL[char]
+    try:
+        code = int.from_bytes(char.encode("gb2312"), "big")
+    except UnicodeEncodeError:
+        return "?"
+    if not GB2312_INITIALS[0][0] <= code < GB2312_LEVEL1_END:
+        return "?"
+    return GB2312_INITIALS[bisect_right(GB2312_INITIALS, (code, "~")) - 1][1]
+
+
+def pinyin_initials(name: str) -> str:
+    """
+    站名拼音首字母, 例如 北京南 -> bjn
+    优先用 pypinyin, 没有安装时按 GB2312 编码近似, 取不到首字母的字记为 '?'(不会被字母前缀匹配到)
+    """
+    if lazy_pinyin is None:
+        return "".join(_gb2312_initial(char) for char in name)
+    return "".join(lazy_pinyin(name, style=Style.FIRST_LETTER)).lower()
+
+
+def _prefix_range(sorted_keys: List[str], prefix: str):
+    """有序列表中以 prefix 开头的下标区间"""
+    start = bisect_left(sorted_keys, prefix)
+    end = bisect_left(sorted_keys, prefix + "\uffff")
+    return start, end
+
+
+class StationIndex:
+    """
+    车站索引, 只在第一次使用时读取 station.json
+    支持 精确名称 / 名称前缀 / 拼音首字母前缀 / 电报码反查 / 同城车站 查询
+    """
+
+    def __init__(self, stations: Dict[str, str]):
+        self.by_name = stations
+        self.by_code = {code: name for name, code in stations.items()}
+        self.names = sorted(stations)
+        self.cities = self._group_cities()
+        initials = sorted((pinyin_initials(name), name) for name in stations)
+        self.initials = [key for key, _ in initials]
+        self.initial_names = [name for _, name in initials]
+
+    def _group_cities(self) -> Dict[str, List[str]]:
+        """按城市分组: 站名的最长前缀若本身也是车站(至少两个字), 视为同一城市, 例如 北京南/北京西 -> 北京"""
+        cities = {}
+        for name in self.names:
+            cities.setdefault(self.city_of(name), []).append(name)
+        return cities
+
+    def code(self, name: str) -> Optional[str]:
+        return self.by_name.get(name)
+
+    def name(self, code: str) -> Optional[str]:
+        return self.by_code.get(code)
+
+    def city_of(self, name: str) -> str:
+        """站名所属城市"""
+        for end in range(len(name) - 1, 1, -1):
+            if name[:end] in self.by_name:
+                return name[:end]
+        return name
+
+    def prefix(self, prefix: str) -> List[str]:
+        """站名前缀查询"""
+        start, end = _prefix_range(self.names, prefix)
+        return self.names[start:end]
+
+    def pinyin_prefix(self, prefix: str) -> List[str]:
+        """拼音首字母前缀查询, 没有匹配时返回空列表"""
+        if not prefix:
+            return []
+        start, end = _prefix_range(self.initials, prefix.lower())
+        return self.initial_names[start:end]
+
+    def city_stations(self, city: str) -> List[str]:
+        """同城所有车站, 传入城市内任意一个站名也可以"""
+        return list(self.cities.get(self.city_of(city), []))
+
+    def search(self, pattern: str) -> List[str]:
+        """
+        通用查询入口:
+        "北京*" -> 前缀; "bjn" -> 拼音首字母; "VNP" -> 电报码反查; 其他 -> 同城车站
+        """
+        if pattern.endswith("*"):
+            return self.prefix(pattern[:-1])
+        if pattern in self.by_code:
+            return [self.by_code[pattern]]
+        if pattern.isascii() and pattern.isalpha():
+            return self.pinyin_prefix(pattern)
+        return self.city_stations(pattern)
+
+    @classmethod
+    def load(cls, file_path: str = STATION_FILE, cache_path: Optional[str] = None) -> "StationIndex":
+        """
+        读取 station.json 并建立索引, 建好的索引序列化到 cache_path,
+        station.json 未修改时直接反序列化, 省去解析和建索引的开销
+        """
+        if cache_path is None:
+            cache_path = os.path.splitext(file_path)[0] + ".idx"
+        stat = os.stat(file_path)
+        signature = (CACHE_VERSION, stat.st_mtime_ns, stat.st_size, lazy_pinyin is not None)
+        try:
+            with open(cache_path, "rb") as file:
+                cached_signature, index = pickle.load(file)
+            if cached_signature == signature:
+                return index
+        except (OSError, pickle.UnpicklingError, EOFError, ValueError):
+            pass
+
+        with open(file_path, "r", encoding="utf-8") as file:
+            index = cls(json.load(file))
+        try:
+            with open(cache_path, "wb") as file:
+                pickle.dump((signature, index), file, protocol=pickle.HIGHEST_PROTOCOL)
+        except OSError as e:
+            print(f"写入车站索引缓存失败: {e}")
+        return index
+
+
+_default_index = None
+_default_lock = threading.Lock()
+
+
+def get_station_index() -> StationIndex:
+    """进程内共享的车站索引"""
+    global _default_index
+    if _default_index is None:
+        with _default_lock:
+            if _default_index is None:
+                _default_index = StationIndex.load()
+    return _default_index
@@ -0,0 +1,117 @@
+"""
+查票流程基准测试, 在本地桩服务上回放录制的 12306 返回数据
+python ticket_bench.py --fixtures fixtures --concurrency 1 10 100
+录制线上数据:
+python ticket_bench.py --record fixtures --date 2025-01-23 --routes BJP:HBB SHH:NJH
+"""
+import argparse
+import json
+import os
+import statistics
+import time
+from typing import List
+
+import requests
+
+from check_ticket import QUERY_HEADERS, QUERY_URL, build_query_params
+from ticket_parser import parse_result
+from ticket_scan import TicketQuery, TicketScanner
+from ticket_stub_server import fixture_name, start_stub_server
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def bench_queries(routes: int, rounds: int, train_date: str) -> List[TicketQuery]:
+    return [TicketQuery(train_date, f"S{i:03d}", "HBB") for i in range(routes)] * rounds
+
+
+def run_bench(query_url: str, concurrency: int, rounds: int, train_date: str) -> dict:
+    """concurrency 条线路并发查询 rounds 轮, 统计端到端延迟/吞吐和解析耗时"""
+    queries = bench_queries(concurrency, rounds, train_date)
+    with TicketScanner(query_url=query_url, max_workers=concurrency, per_host_limit=concurrency) as scanner:
+        # 预热连接池
+        scanner.scan(queries[:concurrency])
+        start = time.perf_counter()
+        results = scanner.scan(queries)
+        wall = time.perf_counter() - start
+
+    latencies = [result.elapsed * 1000 for result in results]
+    ok_results = [result for result in results if result.ok]
+    rows = sum(len(result.trains) for result in ok_results)
+    parse_start = time.perf_counter()
+    for result in ok_results:
+        parse_result(result.trains)
+    parse_cost = time.perf_counter() - parse_start
+    return {
+        "concurrency": concurrency,
+        "requests": len(results),
+        "errors": len(results) - len(ok_results),
+        "wall_s": wall,
+        "req_per_s": len(results) / wall if wall else 0.0,
+        "p50_ms": percentile(latencies, 50),
+        "p90_ms": percentile(latencies, 90),
+        "p99_ms": percentile(latencies, 99),
+        "mean_ms": statistics.mean(latencies) if latencies else 0.0,
+        "parse_us_per_row": parse_cost / rows * 1e6 if rows else 0.0,
+        "parse_ms_per_query": parse_cost / len(ok_results) * 1000 if ok_results else 0.0,
+    }
+
+
+def record_fixtures(fixture_dir: str, train_date: str, routes: List[str]):
+    """从线上接口录制原始返回, 供桩服务回放"""
+    os.makedirs(fixture_dir, exist_ok=True)
+    for route in routes:
+        from_station, to_station = route.split(":")
+        response = requests.get(QUERY_URL, params=build_query_params(train_date, from_station, to_station),
+                                headers=QUERY_HEADERS, timeout=10)
+        try:
+            response.json()
+        except ValueError:
+            print(f"{route}: 返回内容不是 JSON, 跳过")
+            continue
+        path = os.path.join(fixture_dir, fixture_name(train_date, from_station, to_station))
+        with open(path, "wb") as file:
+            file.write(response.content)
+        print(f"{route}: 已保存 {path}")
+
+
+def print_report(reports: List[dict]):
+    header = f"{'并发':>6} {'请求数':>8} {'错误':>6} {'req/s':>10} {'p50(ms)':>9} {'p90(ms)':>9} {'p99(ms)':>9} {'解析(us/行)':>12}"
+    print(header)
+    print("-" * len(header))
+    for r in reports:
+        print(f"{r['concurrency']:>6} {r['requests']:>8} {r['errors']:>6} {r['req_per_s']:>10.1f} "
+              f"{r['p50_ms']:>9.2f} {r['p90_ms']:>9.2f} {r['p99_ms']:>9.2f} {r['parse_us_per_row']:>12.2f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="查票流程基准测试")
+    parser.add_argument("--fixtures", default=None, help="录制数据目录, 不指定时使用伪造数据")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--rounds", type=int, default=5, help="每条线路查询轮数")
+    parser.add_argument("--latency", type=float, default=0.02, help="桩服务的模拟网络延迟(秒)")
+    parser.add_argument("--date", default="2025-01-23")
+    parser.add_argument("--json", action="store_true", help="输出 JSON")
+    parser.add_argument("--record", metavar="DIR", help="从线上录制数据到 DIR 后退出")
+    parser.add_argument("--routes", nargs="*", default=["BJP:HBB"], help="录制的线路, 格式 FROM:TO")
+    args = parser.parse_args()
+
+    if args.record:
+        record_fixtures(args.record, args.date, args.routes)
+    else:
+        server = start_stub_server(latency=args.latency, fixture_dir=args.fixtures)
+        try:
+            reports = [run_bench(server.query_url, concurrency, args.rounds, args.date)
+                       for concurrency in args.concurrency]
+        finally:
+            server.shutdown()
+        if args.json:
+            print(json.dumps(reports, indent=2))
+        else:
+            print_report(reports)
@@ -0,0 +1,224 @@
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from typing import Callable, List, Optional, Sequence, Tuple
+
+from check_ticket import query_left_ticket
+
+# (距发车天数上限, 新鲜期秒数), 越临近发车余票变化越快, 缓存越短; None 表示其余所有日期
+DEFAULT_FRESHNESS = (
+    (1, 30),
+    (3, 60),
+    (7, 180),
+    (None, 600),
+)
+
+
+class CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.stale_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_errors = 0
+
+    @property
+    def requests(self):
+        return self.hits + self.stale_hits + self.misses
+
+    @property
+    def hit_rate(self):
+        """命中率, 过期但仍返回的结果也算命中"""
+        total = self.requests
+        return (self.hits + self.stale_hits) / total if total else 0.0
+
+    def as_dict(self):
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "refresh_errors": self.refresh_errors,
+            "hit_rate": self.hit_rate,
+        }
+
+
+class SqliteCacheStore:
+    """缓存的磁盘层, 多进程/重启后可复用"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "create table if not exists ticket_cache ("
+            "train_date text, from_station text, to_station text, fetched_at real, payload text, "
+            "primary key (train_date, from_station, to_station))"
+        )
+        self._conn.commit()
+
+    def load(self, key: Tuple[str, str, str]):
+        with self._lock:
+            row = self._conn.execute(
+                "select payload, fetched_at from ticket_cache "
+                "where train_date = ? and from_station = ? and to_station = ?", key
+            ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def save(self, key: Tuple[str, str, str], trains: List[str], fetched_at: float):
+        with self._lock:
+            self._conn.execute(
+                "insert or replace into ticket_cache values (?, ?, ?, ?, ?)",
+                (*key, fetched_at, json.dumps(trains, ensure_ascii=False))
+            )
+            self._conn.commit()
+
+    def delete(self, key: Tuple[str, str, str]):
+        with self._lock:
+            self._conn.execute(
+                "delete from ticket_cache where train_date = ? and from_station = ? and to_station = ?", key
+            )
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class TicketCache:
+    """
+    以 (train_date, from_station, to_station) 为 key 的 LRU + TTL 缓存
+    过期后 stale_ttl 秒内仍返回旧数据, 同时在后台线程重新拉取
+    """
+
+    def __init__(self, fetcher: Callable = query_left_ticket, max_entries: int = 1024,
+                 freshness: Sequence[Tuple[Optional[int], float]] = DEFAULT_FRESHNESS,
+                 stale_ttl: float = 300, disk_path: Optional[str] = None,
+                 clock: Callable[[], float] = time.time):
+        self.fetcher = fetcher
+        self.max_entries = max_entries
+        self.freshness = freshness
+        self.stale_ttl = stale_ttl
+        self.clock = clock
+        self.stats = CacheStats()
+        self.disk = SqliteCacheStore(disk_path) if disk_path else None
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._key_locks = {}
+        self._refreshing = set()
+
+    def ttl_for(self, train_date: str) -> float:
+        """按距发车的天数取新鲜期"""
+        try:
+            days = (datetime.strptime(train_date, "%Y-%m-%d").date() - date.today()).days
+        except ValueError:
+            days = None
+        for max_days, ttl in self.freshness:
+            if max_days is None or (days is not None and days <= max_days):
+                return ttl
+        return self.freshness[-1][1]
+
+    def get(self, train_date: str, from_station: str, to_station: str, fetcher: Optional[Callable] = None):
+        """返回余票原始行, 未命中时同步拉取, 拉取失败的异常原样抛出"""
+        key = (train_date, from_station, to_station)
+        fetcher = fetcher or self.fetcher
+        now = self.clock()
+        ttl = self.ttl_for(train_date)
+
+        entry = self._lookup(key)
+        if entry is not None:
+            trains, fetched_at = entry
+            age = now - fetched_at
+            if age <= ttl:
+                self._count("hits")
+                return trains
+            if age <= ttl + self.stale_ttl:
+                self._count("stale_hits")
+                self._refresh_async(key, fetcher)
+                return trains
+
+        # 同一个 key 同时只让一个线程去拉取, 其余线程等它写入缓存
+        with self._key_lock(key):
+            entry = self._lookup(key)
+            if entry is not None and self.clock() - entry[1] <= ttl:
+                self._count("hits")
+                return entry[0]
+            self._count("misses")
+            trains = fetcher(*key)
+            self._put(key, trains, self.clock())
+        return trains
+
+    def invalidate(self, train_date: str, from_station: str, to_station: str):
+        key = (train_date, from_station, to_station)
+        with self._lock:
+            self._entries.pop(key, None)
+        if self.disk is not None:
+            self.disk.delete(key)
+
+    def _lookup(self, key):
+        """先查内存再查磁盘, 返回 (trains, fetched_at) 或 None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                return entry
+        if self.disk is not None:
+            entry = self.disk.load(key)
+            if entry is not None:
+                self._count("disk_hits")
+                self._put(key, entry[0], entry[1], persist=False)
+        return entry
+
+    def _count(self, name: str):
+        """统计计数, 扫描线程和后台刷新线程会同时更新"""
+        with self._lock:
+            setattr(self.stats, name, getattr(self.stats, name) + 1)
+
+    def _key_lock(self, key) -> threading.Lock:
+        with self._lock:
+            lock = self._key_locks.get(key)
+            if lock is None:
+                lock = self._key_locks[key] = threading.Lock()
+            return lock
+
+    def _put(self, key, trains, fetched_at, persist=True):
+        with self._lock:
+            self._entries[key] = (trains, fetched_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._key_locks.pop(evicted, None)
+        if persist and self.disk is not None:
+            self.disk.save(key, trains, fetched_at)
+
+    def _refresh_async(self, key, fetcher):
+        """后台重新拉取, 同一个 key 同时只有一个刷新任务"""
+        with self._lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+
+        def refresh():
+            try:
+                trains = fetcher(*key)
+                self._put(key, trains, self.clock())
+                self._count("refreshes")
+            except Exception as e:
+                self._count("refresh_errors")
+                print(f"刷新缓存失败 {key}: {e}")
+            finally:
+                with self._lock:
+                    self._refreshing.discard(key)
+
+        threading.Thread(target=refresh, daemon=True).start()
+
+    def close(self):
+        if self.disk is not None:
+            self.disk.close()
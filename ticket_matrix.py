@@ -0,0 +1,58 @@
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from station_index import StationIndex, get_station_index
+from ticket_parser import TicketTable, parse_result
+from ticket_scan import ScanResult, TicketQuery, TicketScanner
+
+
+@dataclass
+class CityMatrixResult:
+    from_stations: List[str]
+    to_stations: List[str]
+    table: TicketTable
+    failed: List[ScanResult] = field(default_factory=list)
+
+    def by_train(self) -> dict:
+        """车次号 -> 车次信息"""
+        return {record["train_no"]: record for record in self.table}
+
+
+def city_queries(from_city: str, to_city: str, train_date: str, index: StationIndex) -> List[TicketQuery]:
+    """把两个城市展开成所有 出发站 x 到达站 的查询"""
+    from_codes = [index.code(name) for name in index.city_stations(from_city)]
+    to_codes = [index.code(name) for name in index.city_stations(to_city)]
+    if not from_codes:
+        raise ValueError(f"未找到城市 '{from_city}' 的车站")
+    if not to_codes:
+        raise ValueError(f"未找到城市 '{to_city}' 的车站")
+    return [TicketQuery(train_date, from_code, to_code) for from_code in from_codes for to_code in to_codes]
+
+
+def query_city_matrix(from_city: str, to_city: str, train_date: str,
+                      scanner: Optional[TicketScanner] = None,
+                      index: Optional[StationIndex] = None, store=None) -> CityMatrixResult:
+    """
+    城市到城市查票: 并发查询所有站对, 按车次号去重后合并成一张表
+    12306 对同城车站的查询会返回重复车次, 去重后每个车次只保留一行
+    没有传入 scanner 时, store 交给内部创建的 scanner, 每个站对的结果都会写入
+    """
+    index = index or get_station_index()
+    queries = city_queries(from_city, to_city, train_date, index)
+    own_scanner = scanner is None
+    if own_scanner:
+        scanner = TicketScanner(store=store)
+    try:
+        results = scanner.scan(queries)
+    finally:
+        if own_scanner:
+            scanner.close()
+
+    tables = [parse_result(result.trains) for result in results if result.ok]
+    table = TicketTable.concat(tables).unique_by_train()
+    return CityMatrixResult(
+        from_stations=index.city_stations(from_city),
+        to_stations=index.city_stations(to_city),
+        table=table,
+        failed=[result for result in results if not result.ok],
+    )
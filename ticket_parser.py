@@ -0,0 +1,139 @@
+from array import array
+from typing import Dict, Iterable, List, Optional, Sequence
+
+# 席别 -> result 行中的字段位置, 多个位置时取第一个非空值
+SEAT_FIELDS = {
+    "商务座": (32, 25),
+    "一等座": (31,),
+    "二等座": (30,),
+    "软卧": (23,),
+    "硬卧": (28,),
+    "硬座": (29,),
+    "无座": (26,),
+}
+# "有" 表示余票充足, 接口不给具体数字
+SEAT_PLENTY = 99
+# 空值 / "--" / "*" 表示该车次不设此席别或未开售
+SEAT_NONE = -1
+
+TEXT_COLUMNS = ("train_no", "from_station", "to_station", "start_time", "end_time", "duration", "train_date")
+TEXT_FIELDS = (3, 6, 7, 8, 9, 10, 13)
+
+
+def parse_seat(value: str) -> int:
+    """把余票文本转成整数"""
+    if value == "有":
+        return SEAT_PLENTY
+    if value == "无":
+        return 0
+    if value.isdigit():
+        return int(value)
+    return SEAT_NONE
+
+
+def format_seat(count: int) -> str:
+    """parse_seat 的逆操作, 用于展示"""
+    if count == SEAT_PLENTY:
+        return "有"
+    if count == 0:
+        return "无"
+    if count == SEAT_NONE:
+        return "--"
+    return str(count)
+
+
+def time_to_minutes(value: str) -> int:
+    """"HH:MM" -> 当天的分钟数, 格式不对时返回 -1"""
+    hour, sep, minute = value.partition(":")
+    if not sep or not hour.isdigit() or not minute.isdigit():
+        return -1
+    return int(hour) * 60 + int(minute)
+
+
+class TicketTable:
+    """按列存放的车次余票数据, 过滤方法返回新的 TicketTable, 可以链式调用"""
+
+    def __init__(self, columns: Optional[Dict[str, list]] = None, depart: Optional[array] = None,
+                 seats: Optional[Dict[str, array]] = None):
+        self.columns = columns or {name: [] for name in TEXT_COLUMNS}
+        self.depart = depart if depart is not None else array('h')
+        self.seats = seats or {name: array('h') for name in SEAT_FIELDS}
+
+    def __len__(self):
+        return len(self.depart)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.row(i)
+
+    def append_raw(self, train: str):
+        """追加一行 "|" 分隔的原始数据"""
+        train_info = train.split("|")
+        for name, index in zip(TEXT_COLUMNS, TEXT_FIELDS):
+            self.columns[name].append(train_info[index])
+        self.depart.append(time_to_minutes(train_info[8]))
+        for seat_type, indexes in SEAT_FIELDS.items():
+            value = ""
+            for index in indexes:
+                value = train_info[index]
+                if value:
+                    break
+            self.seats[seat_type].append(parse_seat(value))
+
+    def row(self, i: int) -> dict:
+        """取第 i 行, 返回字典"""
+        record = {name: self.columns[name][i] for name in TEXT_COLUMNS}
+        record["seats"] = {seat_type: counts[i] for seat_type, counts in self.seats.items()}
+        return record
+
+    def take(self, indexes: Sequence[int]) -> "TicketTable":
+        """按行号取子表"""
+        columns = {name: [values[i] for i in indexes] for name, values in self.columns.items()}
+        depart = array('h', [self.depart[i] for i in indexes])
+        seats = {name: array('h', [counts[i] for i in indexes]) for name, counts in self.seats.items()}
+        return TicketTable(columns, depart, seats)
+
+    def has_seat(self, seat_type: str, min_count: int = 1) -> "TicketTable":
+        """保留指定席别余票 >= min_count 的车次"""
+        counts = self.seats[seat_type]
+        return self.take([i for i, count in enumerate(counts) if count >= min_count])
+
+    def depart_between(self, start: str, end: str) -> "TicketTable":
+        """保留出发时间在 [start, end] 内的车次, 时间格式 HH:MM"""
+        low, high = time_to_minutes(start), time_to_minutes(end)
+        return self.take([i for i, minute in enumerate(self.depart) if low <= minute <= high])
+
+    def train_type(self, prefixes: str) -> "TicketTable":
+        """按车次首字母过滤, 例如 "GD" 只保留高铁和动车"""
+        return self.take([i for i, train_no in enumerate(self.columns["train_no"])
+                          if train_no and train_no[0] in prefixes])
+
+    def unique_by_train(self) -> "TicketTable":
+        """按车次号去重, 保留第一次出现的行"""
+        seen = set()
+        indexes = []
+        for i, train_no in enumerate(self.columns["train_no"]):
+            if train_no not in seen:
+                seen.add(train_no)
+                indexes.append(i)
+        return self.take(indexes)
+
+    @classmethod
+    def concat(cls, tables: Iterable["TicketTable"]) -> "TicketTable":
+        """合并多张表"""
+        result = cls()
+        for table in tables:
+            for name in TEXT_COLUMNS:
+                result.columns[name].extend(table.columns[name])
+            result.depart.extend(table.depart)
+            for name in SEAT_FIELDS:
+                result.seats[name].extend(table.seats[name])
+        return result
+
+
+def parse_result(train_list: List[str]) -> TicketTable:
+    """一次遍历把 data["result"] 解析成 TicketTable"""
+    table = TicketTable()
+    for train in train_list:
+        table.append_raw(train)
+    return table
@@ -0,0 +1,121 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Iterator, List
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from check_ticket import QUERY_URL, TicketQueryError, TicketThrottled, query_left_ticket
+from ticket_parser import parse_result
+
+
+@dataclass(frozen=True)
+class TicketQuery:
+    train_date: str
+    from_station: str
+    to_station: str
+
+
+@dataclass
+class ScanResult:
+    query: TicketQuery
+    ok: bool
+    trains: List[str] = field(default_factory=list)
+    error: str = ""
+    elapsed: float = 0.0
+
+
+class TicketScanner:
+    """
+    并发查票: 所有请求共享一个带 keep-alive 连接池的 Session, 并按 host 限制并发数
+    指定 store(TicketStore) 时每次成功的上游查询都追加到时序存储, 缓存命中不重复写入
+    """
+
+    def __init__(self, query_url: str = QUERY_URL, max_workers: int = 16, per_host_limit: int = 4,
+                 timeout: float = 10, cache=None, rate_limiter=None, max_retries: int = 2, store=None):
+        self.query_url = query_url
+        self.cache = cache
+        self.store = store
+        self.rate_limiter = rate_limiter
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.per_host_limit = per_host_limit
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(max_workers, per_host_limit))
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='ticket-scan')
+        self._host_limits: Dict[str, threading.BoundedSemaphore] = {}
+        self._host_lock = threading.Lock()
+
+    def _host_semaphore(self, url: str) -> threading.BoundedSemaphore:
+        """获取 host 对应的并发信号量"""
+        host = urlsplit(url).netloc
+        with self._host_lock:
+            semaphore = self._host_limits.get(host)
+            if semaphore is None:
+                semaphore = threading.BoundedSemaphore(self.per_host_limit)
+                self._host_limits[host] = semaphore
+            return semaphore
+
+    def _fetch(self, train_date: str, from_station: str, to_station: str) -> List[str]:
+        trains = self._download(train_date, from_station, to_station)
+        if self.store is not None:
+            self.store.append(TicketQuery(train_date, from_station, to_station), parse_result(trains))
+        return trains
+
+    def _download(self, train_date: str, from_station: str, to_station: str) -> List[str]:
+        if self.rate_limiter is None:
+            with self._host_semaphore(self.query_url):
+                return query_left_ticket(train_date, from_station, to_station, session=self.session,
+                                         query_url=self.query_url, timeout=self.timeout)
+        # 有限速器时, 被限流的请求在限速器退避结束后重试
+        for attempt in range(self.max_retries + 1):
+            issued_at = self.rate_limiter.acquire()
+            try:
+                with self._host_semaphore(self.query_url):
+                    trains = query_left_ticket(train_date, from_station, to_station, session=self.session,
+                                               query_url=self.query_url, timeout=self.timeout)
+            except TicketThrottled:
+                self.rate_limiter.on_throttled(issued_at)
+                if attempt == self.max_retries:
+                    raise
+                continue
+            self.rate_limiter.on_success()
+            return trains
+
+    def query(self, query: TicketQuery) -> ScanResult:
+        """执行单个查询, 不抛异常, 错误记录在结果中"""
+        start = time.perf_counter()
+        try:
+            if self.cache is not None:
+                trains = self.cache.get(query.train_date, query.from_station, query.to_station,
+                                        fetcher=self._fetch)
+            else:
+                trains = self._fetch(query.train_date, query.from_station, query.to_station)
+            return ScanResult(query, True, trains, elapsed=time.perf_counter() - start)
+        except (requests.exceptions.RequestException, TicketQueryError) as e:
+            return ScanResult(query, False, error=str(e), elapsed=time.perf_counter() - start)
+
+    def scan(self, queries: Iterable[TicketQuery]) -> List[ScanResult]:
+        """并发执行所有查询, 结果顺序与输入一致"""
+        return list(self._executor.map(self.query, queries))
+
+    def scan_iter(self, queries: Iterable[TicketQuery]) -> Iterator[ScanResult]:
+        """并发执行所有查询, 按完成顺序逐个返回结果"""
+        futures = [self._executor.submit(self.query, q) for q in queries]
+        for future in as_completed(futures):
+            yield future.result()
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
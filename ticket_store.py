@@ -0,0 +1,122 @@
+import sqlite3
+import threading
+import time
+from typing import Iterable, List, Optional
+
+from ticket_parser import SEAT_FIELDS, TicketTable, parse_result
+from ticket_scan import ScanResult, TicketQuery
+
+# 席别 -> 表字段
+SEAT_COLUMNS = {
+    "商务座": "business",
+    "一等座": "first_class",
+    "二等座": "second_class",
+    "软卧": "soft_sleeper",
+    "硬卧": "hard_sleeper",
+    "硬座": "hard_seat",
+    "无座": "no_seat",
+}
+SEAT_NAMES = tuple(SEAT_FIELDS)
+
+
+class TicketStore:
+    """
+    余票快照的本地时序存储(sqlite)
+    每行是某一时刻某条线路上一个车次的各席别余票, 写入先缓存在内存里, 攒够 batch_size 行再批量插入
+    """
+
+    def __init__(self, path: str = "ticket_history.db", batch_size: int = 500):
+        self.path = path
+        self.batch_size = batch_size
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("pragma journal_mode = wal")
+        seat_columns = ", ".join(f"{column} integer" for column in SEAT_COLUMNS.values())
+        self._conn.execute(
+            "create table if not exists snapshots ("
+            "ts real, train_date text, from_station text, to_station text, train_no text, "
+            f"start_time text, {seat_columns})"
+        )
+        self._conn.execute(
+            "create index if not exists idx_snapshots_route "
+            "on snapshots (from_station, to_station, train_date, train_no, ts)"
+        )
+        self._conn.execute("create index if not exists idx_snapshots_ts on snapshots (from_station, to_station, ts)")
+        self._conn.commit()
+
+    def append(self, query: TicketQuery, table: TicketTable, ts: Optional[float] = None):
+        """追加一次查询的解析结果"""
+        ts = ts if ts is not None else time.time()
+        seats = [table.seats[name] for name in SEAT_NAMES]
+        columns = table.columns
+        rows = [
+            (ts, query.train_date, query.from_station, query.to_station,
+             columns["train_no"][i], columns["start_time"][i], *(counts[i] for counts in seats))
+            for i in range(len(table))
+        ]
+        with self._lock:
+            self._buffer.extend(rows)
+            if len(self._buffer) >= self.batch_size:
+                self._flush_locked()
+
+    def append_results(self, results: Iterable[ScanResult], ts: Optional[float] = None):
+        """追加 TicketScanner 的扫描结果, 失败的查询跳过"""
+        ts = ts if ts is not None else time.time()
+        for result in results:
+            if result.ok:
+                self.append(result.query, parse_result(result.trains), ts)
+
+    def flush(self):
+        with self._lock:
+            self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._buffer:
+            return
+        placeholders = ", ".join("?" * (6 + len(SEAT_COLUMNS)))
+        self._conn.executemany(f"insert into snapshots values ({placeholders})", self._buffer)
+        self._conn.commit()
+        self._buffer = []
+
+    def history(self, from_station: str, to_station: str, train_date: str,
+                train_no: Optional[str] = None) -> List[dict]:
+        """某天某线路(可指定车次)的所有快照, 按时间排序"""
+        self.flush()
+        sql = "select * from snapshots where from_station = ? and to_station = ? and train_date = ?"
+        params = [from_station, to_station, train_date]
+        if train_no:
+            sql += " and train_no = ?"
+            params.append(train_no)
+        sql += " order by ts"
+        return self._query(sql, params)
+
+    def sellout_times(self, from_station: str, to_station: str, since: float, until: Optional[float] = None,
+                      seat_type: str = "二等座", train_prefix: str = "") -> List[dict]:
+        """
+        [since, until] 内观测到的各车次售罄时间: 该席别余票第一次为 0 的快照时间
+        例如上周 G 字头车次的二等座什么时候卖完: sellout_times("BJP", "HBB", time.time() - 7 * 86400, train_prefix="G")
+        """
+        self.flush()
+        column = SEAT_COLUMNS[seat_type]
+        until = until if until is not None else time.time()
+        sql = (f"select train_date, train_no, min(ts) as sold_out_at from snapshots "
+               f"where from_station = ? and to_station = ? and ts between ? and ? and {column} = 0")
+        params = [from_station, to_station, since, until]
+        if train_prefix:
+            # 用范围比较代替 like, 这样可以走索引
+            sql += " and train_no >= ? and train_no < ?"
+            params += [train_prefix, train_prefix[:-1] + chr(ord(train_prefix[-1]) + 1)]
+        sql += " group by train_date, train_no order by sold_out_at"
+        return self._query(sql, params)
+
+    def _query(self, sql: str, params) -> List[dict]:
+        with self._lock:
+            cursor = self._conn.execute(sql, params)
+            names = [description[0] for description in cursor.description]
+            return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._conn.close()
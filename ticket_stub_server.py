@@ -0,0 +1,186 @@
+"""
+本地 12306 余票接口桩服务, 用于离线压测查票流程
+python ticket_stub_server.py --port 8012 --latency 0.05
+指定 --throttle-rate 后, 超出速率的请求会像线上一样被重定向到 error.html
+指定 --fixtures 后回放录制的接口返回(见 ticket_bench.py --record), 否则按查询参数生成伪造数据
+"""
+import argparse
+import glob
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+ROW_FIELDS = 36
+SEAT_CHOICES = ["有", "无", "", "--", "1", "3", "5", "12", "20"]
+
+
+def make_train_row(train_no, from_station, to_station, start_time, end_time, duration, train_date, seats=None):
+    """按 12306 leftTicket 的字段位置拼出一行 "|" 分隔的车次数据"""
+    fields = [""] * ROW_FIELDS
+    fields[2] = f"{train_no}00"
+    fields[3] = train_no
+    fields[4] = from_station
+    fields[5] = to_station
+    fields[6] = from_station
+    fields[7] = to_station
+    fields[8] = start_time
+    fields[9] = end_time
+    fields[10] = duration
+    fields[11] = "Y"
+    fields[13] = train_date.replace("-", "")
+    for index, value in (seats or {}).items():
+        fields[index] = value
+    return "|".join(fields)
+
+
+def make_result(train_date, from_station, to_station, count=20):
+    """根据查询参数生成确定的伪造结果, 相同参数返回相同数据"""
+    rng = random.Random(f"{train_date}|{from_station}|{to_station}")
+    rows = []
+    for i in range(count):
+        prefix = rng.choice("GDKTZ")
+        depart = rng.randrange(6 * 60, 22 * 60)
+        cost = rng.randrange(90, 12 * 60)
+        arrive = (depart + cost) % (24 * 60)
+        seats = {index: rng.choice(SEAT_CHOICES) for index in (23, 25, 26, 28, 29, 30, 31, 32)}
+        rows.append(make_train_row(
+            f"{prefix}{rng.randrange(1, 9999)}", from_station, to_station,
+            f"{depart // 60:02d}:{depart % 60:02d}", f"{arrive // 60:02d}:{arrive % 60:02d}",
+            f"{cost // 60:02d}:{cost % 60:02d}", train_date, seats))
+    return rows
+
+
+def fixture_name(train_date, from_station, to_station):
+    return f"{train_date}_{from_station}_{to_station}.json"
+
+
+def load_fixtures(fixture_dir):
+    """读取目录下所有录制的接口返回, 文件名 -> 原始字节"""
+    fixtures = {}
+    for path in sorted(glob.glob(os.path.join(fixture_dir, "*.json"))):
+        with open(path, "rb") as file:
+            fixtures[os.path.basename(path)] = file.read()
+    return fixtures
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 才能复用连接, 客户端的连接池才有意义
+    protocol_version = "HTTP/1.1"
+    # 头和正文分两次写出, 不关 Nagle 的话每个请求会多出约 40ms 的延迟确认等待
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        if url.path.endswith("error.html"):
+            self._send(200, "text/html;charset=UTF-8", "<html><body>网络可能存在问题，请您重试一下！</body></html>".encode("utf-8"))
+            return
+        params = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        if not self.server.count_request():
+            self.send_response(302)
+            self.send_header("Location", "/otn/view/error.html")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        train_date = params.get("leftTicketDTO.train_date", "")
+        from_station = params.get("leftTicketDTO.from_station", "")
+        to_station = params.get("leftTicketDTO.to_station", "")
+        body = self.server.fixture_body(train_date, from_station, to_station)
+        if body is None:
+            payload = {
+                "status": True,
+                "data": {
+                    "result": make_result(train_date, from_station, to_station, self.server.rows_per_query)
+                }
+            }
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self._send(200, "application/json;charset=UTF-8", body)
+
+    def _send(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, address, latency=0.0, rows_per_query=20, throttle_rate=None, fixture_dir=None):
+        super().__init__(address, StubHandler)
+        self.fixtures = load_fixtures(fixture_dir) if fixture_dir else {}
+        self._fixture_list = list(self.fixtures.values())
+        self.latency = latency
+        self.rows_per_query = rows_per_query
+        self.throttle_rate = throttle_rate
+        self.request_count = 0
+        self.throttled_count = 0
+        self._recent = deque()
+        self._count_lock = threading.Lock()
+
+    def count_request(self):
+        """记录一次请求, 超过 throttle_rate(次/秒) 时返回 False"""
+        with self._count_lock:
+            self.request_count += 1
+            if self.throttle_rate is None:
+                return True
+            now = time.monotonic()
+            while self._recent and self._recent[0] < now - 1.0:
+                self._recent.popleft()
+            if len(self._recent) >= self.throttle_rate:
+                self.throttled_count += 1
+                return False
+            self._recent.append(now)
+            return True
+
+    def fixture_body(self, train_date, from_station, to_station):
+        """优先返回同线路的录制数据, 没有时按线路哈希选一份录制数据; 未加载录制数据时返回 None"""
+        if not self._fixture_list:
+            return None
+        body = self.fixtures.get(fixture_name(train_date, from_station, to_station))
+        if body is None:
+            key = f"{train_date}|{from_station}|{to_station}"
+            body = self._fixture_list[sum(key.encode("utf-8")) % len(self._fixture_list)]
+        return body
+
+    @property
+    def query_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/otn/leftTicket/queryG"
+
+
+def start_stub_server(host="127.0.0.1", port=0, latency=0.0, rows_per_query=20, throttle_rate=None,
+                      fixture_dir=None):
+    """在后台线程启动桩服务, 返回 server, 用 server.query_url 作为查询地址, 用完调用 server.shutdown()"""
+    server = StubServer((host, port), latency, rows_per_query, throttle_rate, fixture_dir)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="12306 余票接口桩服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8012)
+    parser.add_argument("--latency", type=float, default=0.0, help="每个请求的模拟延迟(秒)")
+    parser.add_argument("--rows", type=int, default=20, help="每次查询返回的车次数")
+    parser.add_argument("--throttle-rate", type=float, default=None, help="每秒允许的请求数, 超出时重定向到 error.html")
+    parser.add_argument("--fixtures", default=None, help="录制数据目录")
+    args = parser.parse_args()
+    server = StubServer((args.host, args.port), args.latency, args.rows, args.throttle_rate, args.fixtures)
+    print(f"stub server listening on {server.query_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,103 @@
+import time
+from dataclasses import dataclass
+from datetime import date, timedelta
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from ticket_parser import SEAT_FIELDS, TicketTable, parse_result
+from ticket_scan import TicketQuery, TicketScanner
+
+SEAT_TYPES = tuple(SEAT_FIELDS)
+
+
+@dataclass(frozen=True)
+class SeatDelta:
+    train_date: str
+    from_station: str
+    to_station: str
+    train_no: str
+    seat_type: str
+    old: Optional[int]
+    new: Optional[int]
+
+
+def date_range(days: int, start: Optional[date] = None) -> List[str]:
+    """从 start(默认今天) 开始连续 days 天的日期字符串"""
+    start = start or date.today()
+    return [(start + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(days)]
+
+
+def table_snapshot(table: TicketTable) -> Dict[str, Tuple[int, ...]]:
+    """车次号 -> 各席别余票元组, 元组整体比较比逐个席别比较快"""
+    columns = [table.seats[seat_type] for seat_type in SEAT_TYPES]
+    return {train_no: tuple(column[i] for column in columns)
+            for i, train_no in enumerate(table.columns["train_no"])}
+
+
+def diff_snapshot(query: TicketQuery, old: Dict[str, Tuple[int, ...]],
+                  new: Dict[str, Tuple[int, ...]]) -> List[SeatDelta]:
+    """对比两次快照, 只返回变化的 (车次, 席别); 新增/消失的车次 old/new 为 None"""
+    deltas = []
+    for train_no, counts in new.items():
+        previous = old.get(train_no)
+        if previous == counts:
+            continue
+        for i, seat_type in enumerate(SEAT_TYPES):
+            before = previous[i] if previous is not None else None
+            if before != counts[i]:
+                deltas.append(SeatDelta(query.train_date, query.from_station, query.to_station,
+                                        train_no, seat_type, before, counts[i]))
+    for train_no, counts in old.items():
+        if train_no not in new:
+            for i, seat_type in enumerate(SEAT_TYPES):
+                deltas.append(SeatDelta(query.train_date, query.from_station, query.to_station,
+                                        train_no, seat_type, counts[i], None))
+    return deltas
+
+
+class DateSweeper:
+    """
+    按日期区间扫描线路余票, 保存每个 (日期, 线路) 的上一次快照, 每轮只输出变化的余票
+    第一次扫描时所有车次都视为新增
+    """
+
+    def __init__(self, routes: List[Tuple[str, str]], days: int = 15, start: Optional[date] = None,
+                 scanner: Optional[TicketScanner] = None, store=None):
+        self.routes = routes
+        self.days = days
+        self.start = start
+        self.scanner = scanner or TicketScanner()
+        if store is not None:
+            # 由 scanner 写入, 每次成功的上游查询都会保存
+            self.scanner.store = store
+        self.snapshots: Dict[TicketQuery, Dict[str, Tuple[int, ...]]] = {}
+
+    def queries(self) -> List[TicketQuery]:
+        return [TicketQuery(train_date, from_station, to_station)
+                for train_date in date_range(self.days, self.start)
+                for from_station, to_station in self.routes]
+
+    def poll(self) -> List[SeatDelta]:
+        """扫描一轮, 返回相对上一轮的变化; 查询失败的线路保留旧快照"""
+        queries = self.queries()
+        deltas = []
+        for result in self.scanner.scan(queries):
+            if not result.ok:
+                print(f"{result.query}: {result.error}")
+                continue
+            table = parse_result(result.trains)
+            snapshot = table_snapshot(table)
+            deltas.extend(diff_snapshot(result.query, self.snapshots.get(result.query, {}), snapshot))
+            self.snapshots[result.query] = snapshot
+        # 日期窗口向后滚动后, 丢掉已经不在窗口内的快照
+        active = set(queries)
+        for query in list(self.snapshots):
+            if query not in active:
+                del self.snapshots[query]
+        return deltas
+
+    def stream(self, interval: float = 60) -> Iterator[SeatDelta]:
+        """持续轮询, 逐条输出变化"""
+        while True:
+            started = time.monotonic()
+            yield from self.poll()
+            time.sleep(max(0.0, interval - (time.monotonic() - started)))
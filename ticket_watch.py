@@ -0,0 +1,276 @@
+"""
+余票监控守护进程
+python ticket_watch.py watches.json
+watches.json 示例:
+[
+    {"train_date": "2025-01-23", "from_station": "BJP", "to_station": "HBB", "seat_type": "二等座", "threshold": 1}
+]
+"""
+import heapq
+import itertools
+import json
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import date, datetime
+from typing import Callable, Dict, List, Optional
+
+import requests
+
+from ticket_parser import SEAT_FIELDS, format_seat, parse_result
+from ticket_scan import TicketQuery, TicketScanner
+
+
+@dataclass(frozen=True)
+class Watch:
+    train_date: str
+    from_station: str
+    to_station: str
+    seat_type: str = "二等座"
+    threshold: int = 1
+    train_no: Optional[str] = None
+
+    def __post_init__(self):
+        # 未知席别在订阅时就拒绝, 否则每轮检查都会出错
+        if self.seat_type not in SEAT_FIELDS:
+            raise ValueError(f"未知的席别 '{self.seat_type}', 可选: {', '.join(SEAT_FIELDS)}")
+
+    @property
+    def query(self) -> TicketQuery:
+        return TicketQuery(self.train_date, self.from_station, self.to_station)
+
+
+@dataclass
+class WatchEvent:
+    watch: Watch
+    train_no: str
+    start_time: str
+    count: int
+    triggered_at: float = field(default_factory=time.time)
+
+    def message(self) -> str:
+        return (f"{self.watch.train_date} {self.watch.from_station}->{self.watch.to_station} "
+                f"{self.train_no} {self.start_time} {self.watch.seat_type}: {format_seat(self.count)}")
+
+    def as_dict(self) -> dict:
+        return {
+            "train_date": self.watch.train_date,
+            "from_station": self.watch.from_station,
+            "to_station": self.watch.to_station,
+            "seat_type": self.watch.seat_type,
+            "train_no": self.train_no,
+            "start_time": self.start_time,
+            "count": self.count,
+            "triggered_at": self.triggered_at,
+        }
+
+
+class StdoutSink:
+    def __call__(self, event: WatchEvent):
+        print(event.message())
+
+
+class FileSink:
+    """每个事件追加一行 JSON"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def __call__(self, event: WatchEvent):
+        with self._lock, open(self.path, "a", encoding="utf-8") as file:
+            file.write(json.dumps(event.as_dict(), ensure_ascii=False) + "\n")
+
+
+class WebhookSink:
+    def __init__(self, url: str, timeout: float = 5):
+        self.url = url
+        self.timeout = timeout
+
+    def __call__(self, event: WatchEvent):
+        try:
+            requests.post(self.url, json=event.as_dict(), timeout=self.timeout)
+        except requests.exceptions.RequestException as e:
+            print(f"webhook 通知失败: {e}")
+
+
+def is_past(train_date: str, today: Optional[date] = None) -> bool:
+    """发车日期已经过去(日期格式不对时不算)"""
+    try:
+        return datetime.strptime(train_date, "%Y-%m-%d").date() < (today or date.today())
+    except ValueError:
+        return False
+
+
+def poll_interval(train_date: str, today: Optional[date] = None) -> float:
+    """发车越近轮询越频繁"""
+    today = today or date.today()
+    try:
+        days = (datetime.strptime(train_date, "%Y-%m-%d").date() - today).days
+    except ValueError:
+        return 600
+    if days <= 1:
+        return 30
+    if days <= 3:
+        return 60
+    if days <= 7:
+        return 180
+    return 600
+
+
+class WatchDaemon:
+    """
+    管理多个余票订阅:
+    相同 (日期, 出发站, 到达站) 的订阅合并成一次上游查询,
+    查询按下次到期时间放在优先队列里, 同时到期时发车日期近的先查,
+    余票从低于阈值变为达到阈值时通知所有 sink
+    """
+
+    def __init__(self, scanner: Optional[TicketScanner] = None, sinks: Optional[List[Callable]] = None,
+                 interval: Callable[[str], float] = poll_interval, batch_size: int = 16, store=None):
+        self.scanner = scanner or TicketScanner()
+        if store is not None:
+            # 由 scanner 写入, 每次成功的上游查询都会保存
+            self.scanner.store = store
+        self.sinks = sinks if sinks is not None else [StdoutSink()]
+        self.interval = interval
+        self.batch_size = batch_size
+        self.watches: Dict[TicketQuery, List[Watch]] = {}
+        self._queue = []
+        self._scheduled = set()
+        self._sequence = itertools.count()
+        self._triggered = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def subscribe(self, watch: Watch):
+        with self._lock:
+            query = watch.query
+            self.watches.setdefault(query, [])
+            if query not in self._scheduled:
+                self._schedule(query, time.monotonic())
+            if watch not in self.watches[query]:
+                self.watches[query].append(watch)
+
+    def unsubscribe(self, watch: Watch):
+        """取消订阅, 查询的最后一个订阅取消后, 该查询出队时会被丢弃"""
+        with self._lock:
+            watches = self.watches.get(watch.query)
+            if watches and watch in watches:
+                watches.remove(watch)
+                if not watches:
+                    del self.watches[watch.query]
+            self._forget([watch])
+
+    def _forget(self, watches: List[Watch]):
+        """清除这些订阅的通知状态, 调用方持有 self._lock"""
+        watches = set(watches)
+        self._triggered = {key for key in self._triggered if key[0] not in watches}
+
+    def _expire(self, query: TicketQuery):
+        """发车日期已过的查询: 丢弃它的所有订阅, 不再入队, 调用方持有 self._lock"""
+        self._forget(self.watches.pop(query, []))
+        self._scheduled.discard(query)
+
+    def _schedule(self, query: TicketQuery, when: float):
+        """入队, 到期时间相同时按发车日期先后"""
+        self._scheduled.add(query)
+        heapq.heappush(self._queue, (when, query.train_date, next(self._sequence), query))
+
+    def _due(self, now: float) -> List[TicketQuery]:
+        due = []
+        with self._lock:
+            while self._queue and self._queue[0][0] <= now and len(due) < self.batch_size:
+                query = heapq.heappop(self._queue)[-1]
+                if query not in self.watches:
+                    self._scheduled.discard(query)
+                elif is_past(query.train_date):
+                    self._expire(query)
+                else:
+                    due.append(query)
+        return due
+
+    def _check(self, query: TicketQuery, trains: List[str]):
+        table = parse_result(trains)
+        with self._lock:
+            watches = list(self.watches.get(query, []))
+        for watch in watches:
+            seats = table.seats[watch.seat_type]
+            for i, train_no in enumerate(table.columns["train_no"]):
+                if watch.train_no and watch.train_no != train_no:
+                    continue
+                key = (watch, train_no)
+                with self._lock:
+                    if seats[i] >= watch.threshold:
+                        notify = key not in self._triggered
+                        self._triggered.add(key)
+                    else:
+                        # 回落到阈值以下后, 下次再达到阈值时重新通知
+                        notify = False
+                        self._triggered.discard(key)
+                if notify:
+                    self._notify(WatchEvent(watch, train_no, table.columns["start_time"][i], seats[i]))
+
+    def _notify(self, event: WatchEvent):
+        for sink in self.sinks:
+            try:
+                sink(event)
+            except Exception as e:
+                print(f"通知失败 {sink}: {e}")
+
+    def run_once(self) -> int:
+        """查询所有到期的订阅, 返回本轮查询数"""
+        due = self._due(time.monotonic())
+        if not due:
+            return 0
+        for result in self.scanner.scan(due):
+            if result.ok:
+                self._check(result.query, result.trains)
+            else:
+                print(f"{result.query}: {result.error}")
+        now = time.monotonic()
+        with self._lock:
+            for query in due:
+                if query not in self.watches:
+                    self._scheduled.discard(query)
+                elif is_past(query.train_date):
+                    self._expire(query)
+                else:
+                    self._schedule(query, now + self.interval(query.train_date))
+        return len(due)
+
+    def run_forever(self, idle: float = 1.0):
+        while not self._stop.is_set():
+            if not self.run_once():
+                with self._lock:
+                    wait = self._queue[0][0] - time.monotonic() if self._queue else idle
+                self._stop.wait(min(max(wait, 0.05), idle))
+
+    def stop(self):
+        self._stop.set()
+
+
+if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="余票监控")
+    parser.add_argument("watch_file", help="订阅列表 JSON 文件")
+    parser.add_argument("--webhook", help="通知的 webhook 地址")
+    parser.add_argument("--output", help="通知追加写入的文件")
+    args = parser.parse_args()
+
+    sinks = [StdoutSink()]
+    if args.webhook:
+        sinks.append(WebhookSink(args.webhook))
+    if args.output:
+        sinks.append(FileSink(args.output))
+    daemon = WatchDaemon(sinks=sinks)
+    with open(args.watch_file, "r", encoding="utf-8") as file:
+        for item in json.load(file):
+            try:
+                daemon.subscribe(Watch(**item))
+            except (TypeError, ValueError) as e:
+                print(f"忽略无效的订阅 {item}: {e}")
+    try:
+        daemon.run_forever()
+    except KeyboardInterrupt:
+        daemon.stop()